@@ -0,0 +1,239 @@
+"""
+Render a library of documents in one job.
+
+    python batch.py books/ --output renders/
+    python batch.py manifest.txt --jobs 4
+
+SOURCE is either a directory, whose .txt and .pdf files are rendered in name
+order, or a manifest: a text file naming one document per line, with paths
+relative to the manifest and blank lines and # comments skipped.
+
+Every document is tokenized first, and the union of their vocabularies is
+scored and featurized once, with a single sentiment backend load, rather than
+once per document. The documents are then rendered in parallel worker
+processes. Each one writes its standard and collapsed images and its pixel
+export to OUTPUT/<name>/, and OUTPUT/index.json lists every document with its
+outputs and dimensions. The stage cache is shared with text_to_image.py and
+precompute_pixels.py, so a document rendered by either is not recomputed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from features import vocabulary_features
+from image_writer import write_image
+from pixel_export import EXPORT_FORMATS, extract_pixels
+from precompute_pixels import WHITE_THRESHOLD
+from sentiment import score_words_cached
+from stage_cache import StageCache
+from text_to_image import (add_render_arguments, analyze_words, cached_render_context, collapsed_dimensions,
+                           non_neutral_pixels, tokenize_document)
+from tokens import TokenSequence
+
+DOCUMENT_EXTENSIONS = ('.txt', '.pdf')
+INDEX_NAME = 'index.json'
+# Pixels per word side in the written images, as in text_to_image.py
+IMAGE_FACTOR = 20
+
+# The shared vocabulary's tables and the job settings, set in each worker by _init_worker
+_shared = {}
+
+
+def list_documents(source):
+    """The document paths named by source, a directory or a manifest file."""
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source))
+                if name.lower().endswith(DOCUMENT_EXTENSIONS) and os.path.isfile(os.path.join(source, name))]
+
+    with open(source, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(os.path.dirname(source), line) for line in lines if line and not line.startswith('#')]
+
+
+def output_names(paths):
+    """A distinct output directory name per document: its file name, numbered when two clash."""
+    names = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, count = stem, 1
+        while name in names:
+            count += 1
+            name = f"{stem}-{count}"
+        names.append(name)
+    return names
+
+
+def shared_vocabulary(vocabularies):
+    """
+    Merge per-document vocabularies into one.
+
+    Returns (vocab, positions): the shared vocabulary, in order of first
+    appearance, and for each document an array giving the index in vocab of
+    each word of its own vocabulary.
+    """
+    index = {}
+    positions = [np.array([index.setdefault(word, len(index)) for word in vocabulary], dtype=np.int64)
+                 for vocabulary in vocabularies]
+    return list(index), positions
+
+
+def _init_worker(scores, table, settings):
+    _shared.update(scores=scores, table=table, settings=settings)
+
+
+def render_document(task):
+    """Worker task: render one tokenized document into its output directory and return its index entry."""
+    name, source, vocab, token_ids, key, positions = task
+    settings = _shared['settings']
+    started = time.perf_counter()
+    directory = os.path.join(settings['output'], name)
+    os.makedirs(directory, exist_ok=True)
+
+    # Look this document's words up in the shared tables instead of scoring them again
+    cache = StageCache(enabled=settings['use_cache'])
+    words = TokenSequence(vocab, token_ids)
+    table = {column: values[positions] for column, values in _shared['table'].items()}
+    words, sentiments, word_features, key = analyze_words(words, key, cache, sentiment_backend=settings['sentiment'],
+                                                          vocab_scores=_shared['scores'][positions],
+                                                          feature_table=table)
+    context = cached_render_context(words, sentiments, word_features, key, cache, max_bytes=settings['max_bytes'],
+                                    dtype=settings['dtype'])
+
+    standard = f"standard_visualization.{settings['image_format']}"
+    write_image(os.path.join(directory, standard), context.rgb, context.width, context.height,
+                factor=IMAGE_FACTOR, compression=settings['compression'])
+
+    kept_pixels = non_neutral_pixels(context.rgb, context.hsv)
+    collapsed_width, collapsed_height = collapsed_dimensions(len(kept_pixels))
+    collapsed = f"collapsed_visualization.{settings['image_format']}"
+    write_image(os.path.join(directory, collapsed), kept_pixels, collapsed_width, collapsed_height,
+                factor=IMAGE_FACTOR, compression=settings['compression'])
+
+    pixels, write = EXPORT_FORMATS[settings['export']]
+    rgb, collapsible = extract_pixels(context.rgb, context.width, context.height, WHITE_THRESHOLD)
+    write(os.path.join(directory, pixels), rgb, context.width, context.height, collapsible)
+
+    return {
+        'name': name,
+        'source': source,
+        'words': len(words),
+        'vocabulary': len(vocab),
+        'width': context.width,
+        'height': context.height,
+        'collapsed_width': collapsed_width,
+        'collapsed_height': collapsed_height,
+        'kept_pixels': len(kept_pixels),
+        'standard': f"{name}/{standard}",
+        'collapsed': f"{name}/{collapsed}",
+        'pixels': f"{name}/{pixels}",
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_jobs(tasks, jobs, scores, table, settings):
+    """Render tasks across jobs processes, yielding (task, entry or exception) as each finishes."""
+    if jobs == 1:
+        _init_worker(scores, table, settings)
+        for task in tasks:
+            try:
+                yield task, render_document(task)
+            except Exception as e:
+                yield task, e
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(scores, table, settings)) as executor:
+        futures = {executor.submit(render_document, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every document of a directory or manifest in one job.")
+    parser.add_argument('source', help="directory of .txt/.pdf files, or a manifest listing one document per line")
+    parser.add_argument('--output', default='renders', help="directory for the outputs and %s" % INDEX_NAME)
+    parser.add_argument('--jobs', type=int, default=0,
+                        help="documents rendered in parallel, each with its own --max-memory (default: one per CPU)")
+    add_render_arguments(parser, workers=False)
+    parser.add_argument('--format', choices=tuple(EXPORT_FORMATS), default='binary',
+                        help="pixel export written per document (default: %(default)s)")
+    args = parser.parse_args(argv)
+    use_cache = not args.no_cache
+
+    paths = list_documents(args.source)
+    if not paths:
+        print(f"Error: no documents found in {args.source}")
+        sys.exit(1)
+    names = output_names(paths)
+    os.makedirs(args.output, exist_ok=True)
+
+    # Tokenize everything up front, so the shared vocabulary is known before any rendering
+    entries = {}
+    documents = []
+    cache = StageCache(enabled=use_cache)
+    for name, path in zip(names, paths):
+        try:
+            words, key = tokenize_document(path, cache)
+            if not len(words):
+                raise ValueError("no words to render")
+        except Exception as e:
+            print(f"Error: skipping {path}: {e}")
+            entries[name] = {'name': name, 'source': path, 'error': str(e)}
+            continue
+        documents.append((name, path, words, key))
+
+    vocab, positions = shared_vocabulary([words.vocab for _, _, words, _ in documents])
+    print(f"\nScoring a shared vocabulary of {len(vocab)} words across {len(documents)} documents...")
+    scores = score_words_cached(vocab, args.sentiment, use_cache)
+    table = vocabulary_features(vocab)
+
+    tasks = [(name, path, words.vocab, words.token_ids, key, document_positions)
+             for (name, path, words, key), document_positions in zip(documents, positions)]
+    jobs = min(args.jobs or os.cpu_count() or 1, max(len(tasks), 1))
+    settings = {
+        'output': args.output,
+        'use_cache': use_cache,
+        'sentiment': args.sentiment,
+        'max_bytes': args.max_memory * 2**20,
+        'dtype': np.float32 if args.float32 else np.float64,
+        'image_format': args.image_format,
+        'compression': args.compression,
+        'export': args.format,
+    }
+
+    print(f"\nRendering {len(tasks)} documents with {jobs} jobs...")
+    for done, (task, result) in enumerate(run_jobs(tasks, jobs, scores, table, settings), 1):
+        name, path = task[:2]
+        if isinstance(result, Exception):
+            print(f"[{done}/{len(tasks)}] Error: {path}: {result}")
+            entries[name] = {'name': name, 'source': path, 'error': str(result)}
+        else:
+            print(f"[{done}/{len(tasks)}] {name}: {result['words']} words, "
+                  f"{result['width']}x{result['height']} in {result['seconds']}s")
+            entries[name] = result
+
+    index = {
+        'sentiment_backend': args.sentiment,
+        'vocabulary': len(vocab),
+        'documents': [entries[name] for name in names],
+    }
+    index_path = os.path.join(args.output, INDEX_NAME)
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=2)
+
+    failed = [entry for entry in index['documents'] if 'error' in entry]
+    print(f"\nRendered {len(names) - len(failed)} of {len(names)} documents, index written to {index_path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
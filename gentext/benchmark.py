@@ -0,0 +1,221 @@
+"""
+Benchmarks for the renderers and the pixel export on synthetic corpora.
+
+Corpora are generated from a seed, so every run and every commit renders the
+same inputs. Each corpus has a size in words (N) and a fraction of
+strong-sentiment words, which sets the number of strong pixels (S) that drive
+the influence pass; the suite times every case of the N x S grid.
+
+Results are appended to benchmark_results.jsonl with the current commit, so
+runs can be compared across commits:
+
+    python benchmark.py                         # full grid, 10k to 5M words
+    python benchmark.py --sizes 10000 100000 --strong-fractions 0.05
+    python benchmark.py --compare HEAD~3        # latest results vs an older commit
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import string
+import subprocess
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+import influence
+from features import WordFeatures, vocabulary_features
+from pixel_export import extract_pixels, write_json
+from profiling import Profiler
+from tokens import TokenSequence
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000, 5_000_000)
+DEFAULT_STRONG_FRACTIONS = (0.01, 0.03, 0.1)
+DEFAULT_VOCAB_SIZE = 20_000
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.jsonl')
+
+
+def synthetic_corpus(num_words, strong_fraction, vocab_size=DEFAULT_VOCAB_SIZE, seed=0):
+    """
+    Generate (words, sentiments, word_features) shaped like analyze_text's output.
+
+    Words are drawn from a Zipf-like distribution over a random vocabulary.
+    A strong_fraction of them get sentiments more than 0.4 from 0.5, half
+    negative and half positive; the rest stay within 0.3 of neutral.
+    """
+    rng = np.random.default_rng(seed)
+    letters = np.array(list(string.ascii_lowercase))
+    lengths = rng.integers(1, 13, size=vocab_size)
+    vocab = list(dict.fromkeys(''.join(rng.choice(letters, size=length)) for length in lengths))
+
+    ranks = np.arange(1, len(vocab) + 1)
+    frequencies = 1 / ranks
+    token_ids = rng.choice(len(vocab), size=num_words, p=frequencies / frequencies.sum()).astype(np.int32)
+
+    sentiments = rng.uniform(0.2, 0.8, size=num_words)
+    strong = rng.random(num_words) < strong_fraction
+    negative = rng.random(num_words) < 0.5
+    sentiments[strong & negative] = rng.uniform(0.0, 0.1, size=(strong & negative).sum())
+    sentiments[strong & ~negative] = rng.uniform(0.9, 1.0, size=(strong & ~negative).sum())
+
+    words = TokenSequence(vocab, token_ids)
+    word_features = WordFeatures(vocab, token_ids, vocabulary_features(vocab))
+    return words, sentiments, word_features
+
+
+def _corpus(words, sentiments, word_features):
+    return words, sentiments, word_features
+
+
+def _render(words, sentiments, word_features, engine):
+    from text_to_image import compute_render_context
+    return (compute_render_context(words, sentiments, word_features, engine=engine),)
+
+
+def _export_json(context):
+    rgb, collapsible = extract_pixels(context.rgb, context.width, context.height, 200)
+    with tempfile.TemporaryDirectory() as directory:
+        write_json(os.path.join(directory, 'pixel_data.json'), rgb, context.width, context.height, collapsible)
+
+
+def benchmark_cases(engine):
+    """
+    The timed operations, as {name: (setup, function)}.
+
+    setup(words, sentiments, word_features) runs once, untimed, and returns
+    the arguments function is timed on; json_export only times the export of
+    an already rendered image.
+    """
+    import text_to_image
+    return {
+        'create_multi_feature_image': (_corpus, partial(text_to_image.create_multi_feature_image, engine=engine)),
+        'create_dual_feature_image': (_corpus, text_to_image.create_dual_feature_image),
+        'create_pattern_image': (_corpus, text_to_image.create_pattern_image),
+        'create_collapsed_sentiment_image': (_corpus, partial(text_to_image.create_collapsed_sentiment_image,
+                                                              engine=engine)),
+        'create_word_length_image': (_corpus, partial(text_to_image.create_word_length_image, engine=engine)),
+        'json_export': (partial(_render, engine=engine), _export_json),
+    }
+
+
+def git_revision():
+    """The current commit, with '-dirty' if the tree has uncommitted changes, or None outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def run_benchmarks(sizes, strong_fractions, renderers=None, engine=influence.DEFAULT_ENGINE, repeat=1, seed=0):
+    """Time every renderer on every corpus; returns one result dict per case, best of repeat runs."""
+    cases = benchmark_cases(engine)
+    renderers = renderers or list(cases)
+    results = []
+
+    for num_words in sizes:
+        for strong_fraction in strong_fractions:
+            words, sentiments, word_features = synthetic_corpus(num_words, strong_fraction, seed=seed)
+            strong_pixels = int((np.abs(sentiments - 0.5) > 0.35).sum())
+            for name in renderers:
+                setup, function = cases[name]
+                profiler = Profiler()
+                # Renderers report progress on stdout/stderr; keep the benchmark output readable
+                with open(os.devnull, 'w') as devnull, \
+                        contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+                    arguments = setup(words, sentiments, word_features)
+                    for _ in range(repeat):
+                        with profiler.stage(name, items=num_words):
+                            function(*arguments)
+                best = min(profiler.report(), key=lambda record: record['wall_s'])
+                peaks = [record['peak_rss_mb'] for record in profiler.report() if record['peak_rss_mb'] is not None]
+                result = {
+                    'renderer': name,
+                    'words': num_words,
+                    'strong_fraction': strong_fraction,
+                    'strong_pixels': strong_pixels,
+                    'engine': engine,
+                    'wall_s': best['wall_s'],
+                    'cpu_s': best['cpu_s'],
+                    'peak_rss_mb': max(peaks) if peaks else None,
+                }
+                results.append(result)
+                peak = 'n/a' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']:.1f}"
+                print(f"{name:<34}{num_words:>10}{strong_pixels:>10}{result['wall_s']:>10.3f}s{peak:>10} MB")
+    return results
+
+
+def record_results(results, path=RESULTS_PATH):
+    """Append a run to the results file, tagged with the commit and environment."""
+    run = {
+        'commit': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    with open(path, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"Recorded {len(results)} results for {run['commit']} in {path}")
+
+
+def load_runs(path=RESULTS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_runs(baseline, current):
+    """Print wall-time ratios (current / baseline) for the cases both runs cover."""
+    def case(result):
+        return result['renderer'], result['words'], result['strong_fraction'], result['engine']
+
+    baseline_times = {case(result): result['wall_s'] for result in baseline['results']}
+    print(f"{'renderer':<34}{'words':>10}{'strong':>8}{'before':>10}{'after':>10}{'ratio':>8}")
+    for result in current['results']:
+        before = baseline_times.get(case(result))
+        if before is None:
+            continue
+        print(f"{result['renderer']:<34}{result['words']:>10}{result['strong_fraction']:>8}"
+              f"{before:>10.3f}{result['wall_s']:>10.3f}{result['wall_s'] / before:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the renderers on synthetic corpora.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="corpus sizes in words")
+    parser.add_argument('--strong-fractions', type=float, nargs='+', default=DEFAULT_STRONG_FRACTIONS,
+                        help="fractions of strong-sentiment words")
+    parser.add_argument('--renderers', nargs='+', help="only time these renderers (default: all)")
+    parser.add_argument('--engine', choices=influence.ENGINES, default=influence.DEFAULT_ENGINE)
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case; the fastest is recorded")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=RESULTS_PATH, help="results file to append to")
+    parser.add_argument('--no-record', action='store_true', help="don't append the results")
+    parser.add_argument('--compare', metavar='COMMIT',
+                        help="compare the latest recorded run with the latest run of COMMIT instead of benchmarking")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        runs = load_runs(args.results)
+        commit = subprocess.run(['git', 'rev-parse', args.compare], capture_output=True, text=True).stdout.strip()
+        baseline = [run for run in runs if run['commit'] and run['commit'].startswith(commit or args.compare)]
+        if not runs or not baseline:
+            parser.error(f"no recorded runs for {args.compare} in {args.results}")
+        compare_runs(baseline[-1], runs[-1])
+        return
+
+    results = run_benchmarks(args.sizes, args.strong_fractions, args.renderers, args.engine, args.repeat, args.seed)
+    if not args.no_record:
+        record_results(results, args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Array versions of the colorsys conversions plus bulk image construction.
+
+The conversions follow colorsys step for step, so a vectorized render gives
+the same bytes as converting each pixel with colorsys.
+"""
+import numpy as np
+
+
+def hsv_to_rgb(hsv):
+    """Convert an (..., 3) array of HSV values in [0, 1] to RGB floats in [0, 1]."""
+    hsv = np.asarray(hsv, dtype=np.float64)
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+
+    i = np.trunc(h * 6.0)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(np.int64) % 6
+
+    sector = [i == k for k in range(6)]
+    r = np.select(sector, [v, q, p, p, t, v])
+    g = np.select(sector, [t, v, v, q, p, p])
+    b = np.select(sector, [p, p, t, v, v, q])
+
+    # Zero saturation is grey regardless of hue
+    grey = s == 0.0
+    rgb = np.stack((r, g, b), axis=-1)
+    rgb[grey] = v[grey][..., np.newaxis]
+    return rgb
+
+
+def rgb_to_hsv(rgb):
+    """Convert an (..., 3) array of RGB floats in [0, 1] to HSV values in [0, 1]."""
+    rgb = np.asarray(rgb, dtype=np.float64)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    rangec = maxc - minc
+    chromatic = rangec > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.where(chromatic, rangec / maxc, 0.0)
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+        h = np.select([r == maxc, g == maxc], [bc - gc, 2.0 + rc - bc], 4.0 + gc - rc)
+        h = np.where(chromatic, (h / 6.0) % 1.0, 0.0)
+
+    return np.stack((h, s, maxc), axis=-1)
+
+
+def to_uint8(rgb):
+    """Scale RGB floats in [0, 1] to bytes, truncating like int(c * 255)."""
+    return (np.asarray(rgb) * 255).astype(np.uint8)
+
+
+def image_from_rgb(rgb, width, height):
+    """
+    Build a PIL image from uint8 RGB pixels given in raster order.
+
+    rgb may hold fewer than width * height pixels; the rest are left black.
+    """
+    from PIL import Image
+
+    rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    if len(rgb) == width * height:
+        buffer = np.ascontiguousarray(rgb)
+    else:
+        buffer = np.zeros((width * height, 3), dtype=np.uint8)
+        buffer[:len(rgb)] = rgb
+    return Image.frombuffer('RGB', (width, height), buffer.tobytes(), 'raw', 'RGB', 0, 1)
+
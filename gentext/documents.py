@@ -0,0 +1,92 @@
+"""
+Reading source documents as streams of text chunks.
+
+Plain text files are read as UTF-8. PDFs are extracted page by page in worker
+processes, and the pages are yielded in order as they finish, so tokenizing
+starts before the whole document has been decoded. Extracted PDF text is
+cached on disk under a hash of the PDF's bytes, so later runs read it back like
+a text file.
+
+PDF support needs the optional pypdf package (pip install pypdf).
+"""
+import os
+
+from stage_cache import CACHE_DIR, atomic_write, file_key
+from tokens import read_text_chunks
+
+PDF_CACHE_DIR = os.path.join(CACHE_DIR, 'pdf_text')
+# Pages extracted per worker task
+PAGES_PER_TASK = 8
+
+
+def is_pdf(file_path):
+    return file_path.lower().endswith('.pdf')
+
+
+def _open_pdf(file_path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError(f"Reading {file_path} requires pypdf: pip install pypdf") from None
+    return PdfReader(file_path)
+
+
+def _extract_pages(file_path, start, stop):
+    """Worker task: the text of pages [start, stop), each ending in a newline."""
+    reader = _open_pdf(file_path)
+    return [(reader.pages[i].extract_text() or '') + '\n' for i in range(start, stop)]
+
+
+def iter_pdf_pages(file_path, workers=None):
+    """
+    Yield the text of each page of a PDF, in page order.
+
+    Pages are extracted in batches of PAGES_PER_TASK across workers processes
+    (default: one per CPU). Only about two batches per worker are in flight at
+    once, so memory stays bounded for large documents.
+    """
+    page_count = len(_open_pdf(file_path).pages)
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    workers = min(workers or os.cpu_count() or 1, max(len(ranges), 1))
+
+    if workers == 1:
+        for start, stop in ranges:
+            yield from _extract_pages(file_path, start, stop)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for start, stop in ranges:
+            pending.append(executor.submit(_extract_pages, file_path, start, stop))
+            if len(pending) >= 2 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def _cached_pdf_chunks(file_path, workers=None):
+    """Yield a PDF's pages, writing them to the text cache as they stream past."""
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    path = os.path.join(PDF_CACHE_DIR, f"{file_key(file_path)}.txt")
+    if os.path.exists(path):
+        print(f"Using cached text of {file_path}")
+        yield from read_text_chunks(path)
+        return
+
+    # Only publish the cache entry once every page has been extracted
+    with atomic_write(path) as temporary:
+        with open(temporary, 'w', encoding='utf-8') as file:
+            for page in iter_pdf_pages(file_path, workers):
+                file.write(page)
+                yield page
+
+
+def read_document_chunks(file_path, use_cache=True, workers=None):
+    """Yield the text of a UTF-8 text file or a PDF as a stream of chunks."""
+    if not is_pdf(file_path):
+        return read_text_chunks(file_path)
+    if use_cache:
+        return _cached_pdf_chunks(file_path, workers)
+    return iter_pdf_pages(file_path, workers)
@@ -0,0 +1,97 @@
+"""
+Columnar per-word features.
+
+Features depend only on the word, so they are computed once per distinct word
+into a table of NumPy columns over the vocabulary, and gathered per token by
+vocabulary index when a renderer needs them.
+"""
+import string
+from collections.abc import Sequence
+
+import numpy as np
+
+from tokens import build_vocabulary
+
+FEATURE_COLUMNS = ('length', 'vowel_ratio', 'first_letter_pos', 'last_letter_pos', 'uppercase_ratio')
+
+
+def word_feature_values(word):
+    """Compute the FEATURE_COLUMNS values of a single word."""
+    # Length of word (normalized)
+    length = len(word) / 20  # Assume max word length of 20
+    length = min(length, 1.0)  # Cap at 1.0
+
+    # Vowel ratio
+    vowels = sum(1 for char in word if char.lower() in 'aeiou')
+    vowel_ratio = vowels / max(len(word), 1)
+
+    # First letter position in alphabet (a=0, z=25)
+    if word and word[0] in string.ascii_letters:
+        first_letter_pos = (ord(word[0].lower()) - ord('a')) / 25
+    else:
+        first_letter_pos = 0.5  # Default for non-letter starting words
+
+    # Last letter position
+    if word and word[-1] in string.ascii_letters:
+        last_letter_pos = (ord(word[-1].lower()) - ord('a')) / 25
+    else:
+        last_letter_pos = 0.5
+
+    # Count uppercase letters ratio (measure of emphasis)
+    if word:
+        uppercase_ratio = sum(1 for char in word if char.isupper()) / len(word)
+    else:
+        uppercase_ratio = 0
+
+    return length, vowel_ratio, first_letter_pos, last_letter_pos, uppercase_ratio
+
+
+def vocabulary_features(vocab):
+    """Feature table for a vocabulary: {column: float64 array aligned with vocab}."""
+    values = np.array([word_feature_values(word) for word in vocab], dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+    return {column: np.ascontiguousarray(values[:, i]) for i, column in enumerate(FEATURE_COLUMNS)}
+
+
+class WordFeatures(Sequence):
+    """
+    Per-token word features stored as columns over the vocabulary.
+
+    features['length'] gathers a whole column as an array, one entry per token.
+    Integer indexing and iteration still give the old per-word dicts, with the
+    word under 'word', for code that expects a list of dicts.
+    """
+
+    def __init__(self, vocab, token_ids, table):
+        self.vocab = vocab
+        self.token_ids = token_ids
+        self.table = table
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def _row(self, token_id):
+        return dict(word=self.vocab[token_id],
+                    **{column: float(self.table[column][token_id]) for column in FEATURE_COLUMNS})
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.table[index][self.token_ids]
+        if isinstance(index, slice):
+            return WordFeatures(self.vocab, self.token_ids[index], self.table)
+        return self._row(self.token_ids[index])
+
+    def __iter__(self):
+        return (self._row(token_id) for token_id in self.token_ids.tolist())
+
+
+def feature_column(word_features, column):
+    """One feature as an array, from WordFeatures or a list of per-word dicts."""
+    if isinstance(word_features, WordFeatures):
+        return word_features[column]
+    return np.array([f[column] for f in word_features], dtype=np.float64)
+
+
+def word_features_for(words):
+    """Compute WordFeatures for a word list or TokenSequence, once per distinct word."""
+    vocab, token_ids = build_vocabulary(words)
+    return WordFeatures(vocab, token_ids, vocabulary_features(vocab))
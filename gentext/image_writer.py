@@ -0,0 +1,184 @@
+"""
+Streaming image output with nearest-neighbour upscaling.
+
+PIL needs a whole image in memory before it can encode it, and upscaling it
+first multiplies that by the square of the factor. The writers here take the
+source image a block of rows at a time instead: each row is widened by
+repeating its pixels and then written out repeat times, so writing an image
+of any size only holds one widened block of rows:
+
+    with open_image('out.png', width * 20, height * 20, compression=1) as image:
+        for rows in blocks:  # uint8 arrays shaped (rows, width * 20, 3)
+            image.write_rows(rows, repeat=20)
+
+Two formats are supported, chosen by file extension:
+
+- .png: zlib-compressed at a configurable level (0-9). Each row is stored with
+        the Sub filter and its repeats with the Up filter, which turns the
+        repeats into runs of zeros that cost next to nothing to compress.
+- .ppm: binary PPM (P6), raw RGB bytes with no compression at all, for
+        pipelines that convert or consume the image straight away.
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+DEFAULT_COMPRESSION = 6
+# Compressed bytes collected before they are written out as one IDAT chunk
+IDAT_SIZE = 1 << 20
+# Widened bytes write_image builds before handing them to the writer
+BLOCK_BYTES = 16 * 2**20
+
+
+class ImageWriter:
+    """Base of the streaming writers: an RGB image written top to bottom, a block of rows at a time."""
+
+    def __init__(self, path, width, height):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.file = open(path, 'wb')
+
+    def write_rows(self, rows, repeat=1):
+        """Append rows, a uint8 array of shape (count, width, 3), writing each one repeat times."""
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(-1, self.width * 3)
+        if self.rows_written + len(rows) * repeat > self.height:
+            raise ValueError(f"{self.path} only has {self.height} rows")
+        self._write_scanlines(rows, repeat)
+        self.rows_written += len(rows) * repeat
+
+    def _write_scanlines(self, rows, repeat):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        """Finish the image; every row must have been written."""
+        if self.file is None:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Wrote {self.rows_written} of {self.height} rows to {self.path}")
+            self._finish()
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.file is not None:
+            # Leave the incomplete file as is rather than masking the original error
+            self.file.close()
+            self.file = None
+
+
+class PNGWriter(ImageWriter):
+    """Write an 8-bit RGB PNG, compressed at zlib level compression."""
+
+    def __init__(self, path, width, height, compression=DEFAULT_COMPRESSION):
+        super().__init__(path, width, height)
+        self.compressor = zlib.compressobj(compression)
+        self.pending = []
+        self.pending_size = 0
+        # A repeated row, filtered against the identical row above it
+        self.repeat_line = b'\x02' + bytes(width * 3)
+
+        self.file.write(PNG_SIGNATURE)
+        # 8 bits per channel, colour type 2 (RGB), default compression and filtering, no interlace
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def _flush_pending(self):
+        if self.pending:
+            self._write_chunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def _queue(self, data):
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+            if self.pending_size >= IDAT_SIZE:
+                self._flush_pending()
+
+    def _write_scanlines(self, rows, repeat):
+        # Sub filter: every byte after the first pixel minus the byte one pixel to its left
+        scanlines = np.empty((len(rows), 1 + self.width * 3), dtype=np.uint8)
+        scanlines[:, 0] = 1
+        scanlines[:, 1:4] = rows[:, :3]
+        np.subtract(rows[:, 3:], rows[:, :-3], out=scanlines[:, 4:])
+
+        repeats = self.repeat_line * (repeat - 1)
+        for scanline in scanlines:
+            self._queue(self.compressor.compress(scanline.data))
+            self._queue(self.compressor.compress(repeats))
+
+    def _finish(self):
+        self._queue(self.compressor.flush())
+        self._flush_pending()
+        self._write_chunk(b'IEND', b'')
+
+
+class PPMWriter(ImageWriter):
+    """Write an uncompressed binary PPM (P6)."""
+
+    def __init__(self, path, width, height):
+        super().__init__(path, width, height)
+        self.file.write(f'P6\n{width} {height}\n255\n'.encode('ascii'))
+
+    def _write_scanlines(self, rows, repeat):
+        if repeat == 1:
+            self.file.write(rows.data)
+            return
+        for row in rows:
+            self.file.write(row.tobytes() * repeat)
+
+
+IMAGE_WRITERS = {
+    '.png': PNGWriter,
+    '.ppm': PPMWriter,
+}
+
+
+def open_image(path, width, height, compression=DEFAULT_COMPRESSION):
+    """Open the IMAGE_WRITERS writer for path's extension; compression only applies to PNG."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in IMAGE_WRITERS:
+        raise ValueError(f"Can't stream {path}, expected one of {tuple(IMAGE_WRITERS)}")
+    if extension == '.png':
+        return PNGWriter(path, width, height, compression)
+    return IMAGE_WRITERS[extension](path, width, height)
+
+
+def write_image(path, rgb, width, height, factor=1, compression=DEFAULT_COMPRESSION, block_rows=None):
+    """
+    Stream uint8 RGB pixels in raster order to an image, upscaled by an integer factor.
+
+    rgb may hold fewer than width * height pixels; the rest are black. Source
+    rows are widened and written block_rows at a time (by default as many as
+    fit in BLOCK_BYTES once widened), so the full-size image is never held in
+    memory. The result matches PIL's NEAREST resize to the multiplied size.
+    """
+    rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    if block_rows is None:
+        block_rows = max(1, BLOCK_BYTES // (width * factor * 3))
+    with open_image(path, width * factor, height * factor, compression) as image:
+        for first_row in range(0, height, block_rows):
+            rows = min(block_rows, height - first_row)
+            block = np.zeros((rows * width, 3), dtype=np.uint8)
+            pixels = rgb[first_row * width:(first_row + rows) * width]
+            block[:len(pixels)] = pixels
+            image.write_rows(np.repeat(block.reshape(rows, width, 3), factor, axis=1), repeat=factor)
@@ -0,0 +1,114 @@
+"""
+Snapshots of a previous run, for re-rendering a source incrementally after an edit.
+
+A snapshot keeps what the next run needs to reuse: the token stream, the
+sentiment scores and features of every word in its vocabulary, the final
+per-word sentiments and the rendered HSV field. Snapshots are stored per
+source file and per script under .cache/incremental/, so each script diffs
+against its own last output:
+
+    python text_to_image.py text.txt --incremental
+    python precompute_pixels.py text.txt --incremental
+
+Only snapshots written with the same parameters (pipeline stage versions,
+sentiment backend, precision) are reused; anything else is a full render.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from features import FEATURE_COLUMNS
+from stage_cache import CACHE_DIR, atomic_write
+from tokens import pack_vocabulary, unpack_vocabulary
+
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'incremental')
+
+# Bump to invalidate every snapshot after an incompatible change
+SNAPSHOT_FORMAT = 2
+
+
+def snapshot_path(source, name, directory=SNAPSHOT_DIR):
+    """Where the snapshot of script name's last run over source lives."""
+    digest = hashlib.sha256(os.path.abspath(source).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(directory, f"{name}-{digest}.npz")
+
+
+def save_snapshot(path, params, vocab, token_ids, vocab_scores, feature_table, sentiments, hsv, width, height,
+                  export_key=''):
+    """
+    Write a snapshot; vocab_scores and feature_table are aligned with vocab.
+
+    export_key is the file_key of an export written from hsv, if any, so the
+    next run can tell whether that file can be patched in place.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    vocab_data, vocab_offsets = pack_vocabulary(vocab)
+    arrays = {
+        'params': np.array(json.dumps({'format': SNAPSHOT_FORMAT, **params}, sort_keys=True)),
+        'vocab_data': vocab_data,
+        'vocab_offsets': vocab_offsets,
+        'token_ids': token_ids,
+        'vocab_scores': vocab_scores,
+        'sentiments': np.asarray(sentiments, dtype=np.float64),
+        'hsv': hsv,
+        'width': np.array(width),
+        'height': np.array(height),
+        'export_key': np.array(export_key),
+    }
+    arrays.update({f'feature_{column}': feature_table[column] for column in FEATURE_COLUMNS})
+
+    with atomic_write(path) as temporary:
+        np.savez(temporary, **arrays)
+
+
+def load_snapshot(path, params):
+    """
+    Read a snapshot back as a dict, or None if there is none for these params.
+
+    The dict has the save_snapshot arguments, with vocab as a list, the
+    feature table under 'features' and width and height as ints.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as stored:
+        if str(stored['params']) != json.dumps({'format': SNAPSHOT_FORMAT, **params}, sort_keys=True):
+            return None
+        snapshot = {name: stored[name] for name in stored.files}
+
+    return {
+        'vocab': unpack_vocabulary(snapshot['vocab_data'], snapshot['vocab_offsets']),
+        'token_ids': snapshot['token_ids'],
+        'vocab_scores': snapshot['vocab_scores'],
+        'features': {column: snapshot[f'feature_{column}'] for column in FEATURE_COLUMNS},
+        'sentiments': snapshot['sentiments'],
+        'hsv': snapshot['hsv'],
+        'width': int(snapshot['width']),
+        'height': int(snapshot['height']),
+        'export_key': str(snapshot['export_key']),
+    }
+
+
+def vocabulary_mapping(vocab, previous_vocab):
+    """For each word of vocab, its index in previous_vocab, or -1 if it is new."""
+    positions = {word: i for i, word in enumerate(previous_vocab)}
+    return np.array([positions.get(word, -1) for word in vocab], dtype=np.int64)
+
+
+def changed_span(token_ids, previous_token_ids, mapping):
+    """
+    The (start, end) span of token_ids that differs from the previous stream.
+
+    mapping is vocabulary_mapping(vocab, previous_vocab). Tokens before start
+    and from end on match the previous stream's common prefix and suffix, so
+    an edit in one place gives a span covering just that edit.
+    """
+    ids = mapping[token_ids]
+    common = min(len(ids), len(previous_token_ids))
+    mismatches = np.flatnonzero(ids[:common] != previous_token_ids[:common])
+    prefix = int(mismatches[0]) if len(mismatches) else common
+
+    mismatches = np.flatnonzero(ids[::-1][:common - prefix] != previous_token_ids[::-1][:common - prefix])
+    suffix = int(mismatches[0]) if len(mismatches) else common - prefix
+    return prefix, len(ids) - suffix
@@ -0,0 +1,653 @@
+"""
+Influence engines for the weak-pixel "bleed" pass of create_multi_feature_image.
+
+Every engine turns a batch of weak pixels into (weak, strong) pairs that lie
+inside the strong pixel's influence radius, in row-major order. The pairs are
+then fed through one shared kernel, so all engines produce identical output:
+
+- dense: builds the full batch x strong distance matrix (the original approach)
+- grid:  buckets strong pixels by the grid cells their reach can touch, so each
+         weak pixel only visits strong pixels that can actually influence it
+
+As in the original renderer, each pair's influence falls off over the radius
+of its radius group, RADIUS_GROUP_SIZE consecutive weak pixels, rather than
+its own strong pixel's. Batches of weak pixels only write to their own
+pixels, so apply_influence can also spread them over a process pool working
+on shared-memory arrays.
+"""
+import math
+
+import numpy as np
+
+ENGINES = ('dense', 'grid')
+DEFAULT_ENGINE = 'grid'
+GRID_CELL_SIZE = 8
+# Ceiling on the influence pass's pairwise temporaries, across all workers
+DEFAULT_MAX_BYTES = 256 * 2**20
+# Preferred temporaries per batch: batches that stay cache-sized run fastest
+BATCH_BYTES = 4 * 2**20
+# Weak pixels per batch in the original renderer, which divided every pair of a batch by one radius
+RADIUS_GROUP_SIZE = 1000
+
+
+def strong_neighbours(strong_coords, width, height, radius):
+    """
+    List every pair of distinct strong pixels closer than radius, sorted by (i, j).
+
+    Pixels sit on the integer grid, so instead of a full pairwise distance
+    matrix we look up each strong pixel's neighbours at every offset inside
+    the radius by binary search over the strong pixels' sorted raster
+    indices, which keeps memory proportional to the strong pixels alone.
+    """
+    raster = strong_coords[:, 1] * width + strong_coords[:, 0]
+    order = np.argsort(raster, kind='stable')
+    sorted_raster = raster[order]
+
+    span = math.ceil(radius)
+    offset_x, offset_y = np.meshgrid(np.arange(-span, span + 1), np.arange(-span, span + 1))
+    offset_x = offset_x.ravel()
+    offset_y = offset_y.ravel()
+    offset_distances = np.sqrt(offset_x**2 + offset_y**2)
+    inside = (offset_distances < radius) & (offset_distances > 0)
+
+    firsts, seconds, distances = [], [], []
+    for ox, oy, distance in zip(offset_x[inside], offset_y[inside], offset_distances[inside]):
+        x = strong_coords[:, 0] + ox
+        y = strong_coords[:, 1] + oy
+        in_bounds = np.nonzero((x >= 0) & (x < width) & (y >= 0) & (y < height))[0]
+        targets = y[in_bounds] * width + x[in_bounds]
+        positions = np.minimum(np.searchsorted(sorted_raster, targets), max(len(sorted_raster) - 1, 0))
+        found = sorted_raster[positions] == targets
+        firsts.append(in_bounds[found])
+        seconds.append(order[positions[found]])
+        distances.append(np.full(found.sum(), distance))
+
+    firsts = np.concatenate(firsts)
+    seconds = np.concatenate(seconds)
+    distances = np.concatenate(distances)
+    order = np.lexsort((seconds, firsts))
+    return firsts[order], seconds[order], distances[order]
+
+
+def cluster_boosts(strong_coords, is_negative, width, height):
+    """
+    Compute both same-sentiment cluster boosts once per render.
+
+    Returns (similar_boosts, strong_boosts): the distance-weighted boost from
+    same-type neighbours within 4 cells that widens a strong pixel's influence,
+    and the count-based boost from neighbours within 3 cells that brightens
+    the strong pixel itself.
+    """
+    count = len(strong_coords)
+    firsts, seconds, distances = strong_neighbours(strong_coords, width, height, 4)
+    same_type = is_negative[firsts] == is_negative[seconds]
+    firsts = firsts[same_type]
+    distances = distances[same_type]
+
+    similar_boosts = np.bincount(firsts, weights=np.maximum(0, 1 - (distances / 4)) * 0.45, minlength=count)
+    strong_boosts = np.bincount(firsts[distances < 3], minlength=count) * 0.15
+    return similar_boosts, strong_boosts
+
+
+def strong_field(strong_indices, strong_coords, strong_sentiments, base_strengths,
+                 similar_boosts, strong_hues, strong_vowel_ratios, strong_lengths, strong_intensities):
+    """
+    Collect every per-strong-pixel quantity the influence pass needs.
+
+    Every argument is aligned with strong_indices, the strong pixels' raster
+    indices.
+    """
+    is_negative = strong_sentiments < 0.5
+    influence_strengths = np.where(is_negative,
+                                   base_strengths * 1.45,
+                                   base_strengths * 0.95)
+
+    # Calculate influence radii
+    base_radii = np.where(is_negative, 4.2, 3.8)
+    strength_factors = np.where(is_negative, 5.7, 4.8)
+    influence_radii = (base_radii + influence_strengths * strength_factors) * (1 + similar_boosts)
+
+    # Calculate grid and linear weights
+    grid_weights = np.where(is_negative, 0.65, 0.7)
+    linear_weights = np.where(is_negative, 0.35, 0.3)
+    distance_scales = np.where(is_negative, 0.85, 1.0) * (1 - similar_boosts * 0.7)
+
+    # Calculate influenced colors
+    strong_sats = (0.6 + strong_vowel_ratios * 0.4) * strong_intensities
+    strong_vals = 0.7 + strong_lengths * 0.3
+
+    # Apply cluster boosts to strong colors
+    cluster_boosts = 1 + similar_boosts * 1.5
+    strong_sats = np.minimum(1.0, strong_sats * np.where(is_negative, 2.0, 1.95) * cluster_boosts)
+    strong_vals = np.minimum(1.0, strong_vals * 1.85 * cluster_boosts)
+
+    return {
+        'indices': strong_indices,
+        'coords': strong_coords,
+        'is_negative': is_negative,
+        'strengths': influence_strengths,
+        'boosts': similar_boosts,
+        'radii': influence_radii,
+        'grid_weights': grid_weights,
+        'linear_weights': linear_weights,
+        'distance_scales': distance_scales,
+        'type_factors': np.where(is_negative, 1.95, 1.5),
+        'hues': strong_hues,
+        'sats': strong_sats,
+        'vals': strong_vals,
+    }
+
+
+def influence_reach(field):
+    """
+    Upper bound on the grid distance at which each strong pixel has any influence.
+
+    The linear-distance term only ever adds to the adjusted distance, so a weak
+    pixel further than radius / (grid_weight * distance_scale) can't be reached.
+    Heavily boosted pixels can have a non-positive distance scale, which makes
+    their reach unbounded.
+    """
+    denominators = field['grid_weights'] * field['distance_scales']
+    with np.errstate(divide='ignore'):
+        return np.where(denominators > 0, field['radii'] / denominators, np.inf)
+
+
+def select_strong(field, mask):
+    """The part of field belonging to the strong pixels selected by mask."""
+    return {name: array[mask] for name, array in field.items()}
+
+
+def changed_strong(field, previous):
+    """
+    Mask of field's strong pixels whose influence differs from previous's.
+
+    A strong pixel is unchanged when previous has a strong pixel at the same
+    raster index with exactly the same field values, so it bleeds into every
+    weak pixel exactly as before. previous may be None for a render without
+    strong pixels.
+    """
+    if previous is None or not len(previous['indices']):
+        return np.ones(len(field['indices']), dtype=bool)
+    positions = np.minimum(np.searchsorted(previous['indices'], field['indices']), len(previous['indices']) - 1)
+    same = previous['indices'][positions] == field['indices']
+    for name, array in field.items():
+        same &= (previous[name][positions] == array).reshape(len(array), -1).all(axis=1)
+    return ~same
+
+
+def raster_reach(field, width):
+    """
+    Upper bound on the raster index distance at which each strong pixel has any influence.
+
+    The linear-distance term alone keeps a strong pixel from reaching indices
+    further than 7 * radius / (linear_weight * distance_scale) away, and the
+    grid term from reaching more than influence_reach rows up or down; the
+    tighter of the two applies. Unbounded pixels reach every index.
+    """
+    denominators = field['linear_weights'] * field['distance_scales']
+    with np.errstate(divide='ignore'):
+        linear = np.where(denominators > 0, 7 * field['radii'] / denominators, np.inf)
+    # One row of slack keeps the grid bound conservative against rounding
+    return np.minimum(linear, (np.floor(influence_reach(field)) + 2) * width)
+
+
+def reached_pixels(field, width, num_pixels, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Mask of the pixels that any strong pixel in field bleeds into.
+
+    Only the raster_reach window around each strong pixel is searched; pixels
+    in it are kept when their adjusted distance is below the radius. The
+    comparison has a little slack, so a float32 render is never under-counted.
+    """
+    reached = np.zeros(num_pixels, dtype=bool)
+    if not len(field['indices']) or not num_pixels:
+        return reached
+
+    spans = np.floor(np.minimum(raster_reach(field, width), num_pixels)).astype(np.int64)
+    lows = np.clip(field['indices'] - spans, 0, num_pixels)
+    highs = np.clip(field['indices'] + spans + 1, 0, num_pixels)
+    counts = highs - lows
+
+    # Two float buffers and the int64 pixel and owner indices per candidate
+    for start, end in plan_batches(counts * 32, min(BATCH_BYTES, max_bytes)):
+        owners = np.repeat(np.arange(start, end), counts[start:end])
+        batch_counts = counts[start:end]
+        offsets = np.arange(len(owners)) - np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+        pixels = lows[owners] + offsets
+
+        dx = (pixels % width - field['coords'][owners, 0]).astype(np.float64)
+        dy = (pixels // width - field['coords'][owners, 1]).astype(np.float64)
+        adjusted_distances = _adjust_distances(dx, dy, pixels, field['indices'][owners],
+                                               field['grid_weights'][owners], field['linear_weights'][owners],
+                                               field['distance_scales'][owners])
+        reached[pixels[adjusted_distances < field['radii'][owners] * (1 + 1e-6)]] = True
+    return reached
+
+
+def build_grid_index(field, width, height, cell_size=GRID_CELL_SIZE):
+    """
+    Register each strong pixel in every grid cell its reach overlaps.
+
+    Returns a CSR-style index: members of cell c are
+    members[starts[c]:starts[c + 1]], in ascending strong order.
+    """
+    cells_x = -(-width // cell_size)
+    cells_y = -(-height // cell_size)
+
+    # One pixel of slack keeps the bound conservative against rounding
+    reach = influence_reach(field) + 1
+    strong_x = field['coords'][:, 0]
+    strong_y = field['coords'][:, 1]
+    x0 = np.clip(np.floor((strong_x - reach) / cell_size), 0, cells_x - 1).astype(np.int64)
+    x1 = np.clip(np.floor((strong_x + reach) / cell_size), 0, cells_x - 1).astype(np.int64)
+    y0 = np.clip(np.floor((strong_y - reach) / cell_size), 0, cells_y - 1).astype(np.int64)
+    y1 = np.clip(np.floor((strong_y + reach) / cell_size), 0, cells_y - 1).astype(np.int64)
+
+    # Enumerate the covered cells of every strong pixel
+    span_x = x1 - x0 + 1
+    counts = span_x * (y1 - y0 + 1)
+    owners = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cells = (y0[owners] + offsets // span_x[owners]) * cells_x + x0[owners] + offsets % span_x[owners]
+
+    # A stable sort keeps strong pixels in ascending order inside each cell
+    order = np.argsort(cells, kind='stable')
+    starts = np.zeros(cells_x * cells_y + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=cells_x * cells_y), out=starts[1:])
+
+    return {
+        'cell_size': cell_size,
+        'cells_x': cells_x,
+        'starts': starts,
+        'members': owners[order],
+    }
+
+
+class Scratch:
+    """Grow-only buffers reused from batch to batch instead of reallocated."""
+
+    def __init__(self):
+        self.buffers = {}
+
+    def take(self, name, shape, dtype):
+        """An uninitialized array of the given shape backed by the buffer called name."""
+        size = math.prod(shape)
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = self.buffers[name] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+
+def _adjust_distances(dx, dy, weak, strong_indices, grid_weights, linear_weights, distance_scales):
+    """
+    Adjusted distances from coordinate differences, computed in place in dx.
+
+    Evaluates (grid_weight * distance + linear_weight * (linear_distance / 7)) * distance_scale
+    with the same rounding as the direct expression; dy is reused for the
+    linear distances.
+    """
+    np.multiply(dx, dx, out=dx)
+    np.multiply(dy, dy, out=dy)
+    np.add(dx, dy, out=dx)
+    np.sqrt(dx, out=dx)
+    np.multiply(dx, grid_weights, out=dx)
+
+    np.subtract(weak, strong_indices, out=dy, casting='unsafe')
+    np.abs(dy, out=dy)
+    np.divide(dy, 7, out=dy)
+    np.multiply(dy, linear_weights, out=dy)
+    np.add(dx, dy, out=dx)
+    np.multiply(dx, distance_scales, out=dx)
+    return dx
+
+
+def dense_pairs(batch_weak, batch_coords, field, index, scratch):
+    """Find influencing pairs by testing every weak pixel against every strong pixel."""
+    strong_coords = field['coords']
+    shape = (len(batch_weak), len(strong_coords))
+    dtype = field['radii'].dtype
+
+    # Calculate distances to all strong pixels
+    dx = scratch.take('dx', shape, dtype)
+    dy = scratch.take('dy', shape, dtype)
+    np.subtract(batch_coords[:, 0, np.newaxis], strong_coords[:, 0], out=dx, casting='unsafe')
+    np.subtract(batch_coords[:, 1, np.newaxis], strong_coords[:, 1], out=dy, casting='unsafe')
+
+    # Calculate adjusted distances
+    adjusted_distances = _adjust_distances(dx, dy, batch_weak[:, np.newaxis], field['indices'],
+                                           field['grid_weights'], field['linear_weights'],
+                                           field['distance_scales'])
+
+    influence_mask = scratch.take('mask', shape, bool)
+    np.less(adjusted_distances, field['radii'], out=influence_mask)
+    rows, cols = np.nonzero(influence_mask)
+    return rows, cols, adjusted_distances[rows, cols]
+
+
+def grid_pairs(batch_weak, batch_coords, field, index, scratch):
+    """Find influencing pairs using only the strong pixels registered in each weak pixel's cell."""
+    cell_size = index['cell_size']
+    cells = (batch_coords[:, 1] // cell_size) * index['cells_x'] + batch_coords[:, 0] // cell_size
+    starts = index['starts'][cells]
+    counts = index['starts'][cells + 1] - starts
+
+    rows = np.repeat(np.arange(len(batch_weak)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = index['members'][np.repeat(starts, counts) + offsets]
+
+    # Adjusted distances for every candidate pair, matching the dense formula
+    dtype = field['radii'].dtype
+    dx = scratch.take('dx', rows.shape, dtype)
+    dy = scratch.take('dy', rows.shape, dtype)
+    np.subtract(batch_coords[rows, 0], field['coords'][cols, 0], out=dx, casting='unsafe')
+    np.subtract(batch_coords[rows, 1], field['coords'][cols, 1], out=dy, casting='unsafe')
+    adjusted_distances = _adjust_distances(dx, dy, batch_weak[rows], field['indices'][cols],
+                                           field['grid_weights'][cols], field['linear_weights'][cols],
+                                           field['distance_scales'][cols])
+
+    keep = scratch.take('mask', rows.shape, bool)
+    np.less(adjusted_distances, field['radii'][cols], out=keep)
+    return rows[keep], cols[keep], adjusted_distances[keep]
+
+
+PAIR_FINDERS = {
+    'dense': dense_pairs,
+    'grid': grid_pairs,
+}
+
+
+def candidate_counts(batch_coords, field, engine, index=None):
+    """How many (weak, strong) candidate pairs the engine examines for each weak pixel."""
+    if engine == 'dense':
+        return np.full(len(batch_coords), len(field['coords']), dtype=np.int64)
+    cell_size = index['cell_size']
+    cells = (batch_coords[:, 1] // cell_size) * index['cells_x'] + batch_coords[:, 0] // cell_size
+    return index['starts'][cells + 1] - index['starts'][cells]
+
+
+def candidate_bytes(engine, dtype):
+    """
+    Estimated peak temporary bytes per candidate pair.
+
+    Both engines hold two float buffers and a mask per candidate; the grid
+    engine also holds int64 row, column and gather positions, and the pairs
+    that survive are gathered into a few more arrays for blending.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    per_pair = 2 * itemsize + 1
+    if engine == 'grid':
+        per_pair += 3 * 8 + 4 * itemsize
+    return per_pair
+
+
+def plan_batches(costs, max_bytes):
+    """
+    Split pixels into consecutive (start, end) batches whose costs fit in max_bytes.
+
+    A single pixel that is over budget on its own still gets a batch.
+    """
+    totals = np.cumsum(costs)
+    batches = []
+    start = 0
+    while start < len(costs):
+        spent = totals[start - 1] if start else 0
+        end = max(int(np.searchsorted(totals, spent + max_bytes, side='right')), start + 1)
+        batches.append((start, end))
+        start = end
+    return batches
+
+
+def group_batches(groups, costs, max_bytes):
+    """
+    plan_batches over whole radius groups: no batch splits the run of weak pixels of a group.
+
+    A group that is over budget on its own still gets a batch.
+    """
+    starts = np.flatnonzero(np.diff(groups, prepend=groups[0] - 1))
+    bounds = np.append(starts, len(groups))
+    return [(int(bounds[start]), int(bounds[end]))
+            for start, end in plan_batches(np.add.reduceat(costs, starts), max_bytes)]
+
+
+def _group_firsts(batch_groups, rows, cols, num_strong):
+    """
+    For each run of a group in a batch, the first strong pixel, in field
+    order, influencing any of its weak pixels; num_strong where none does.
+    Returns (run starts, firsts).
+    """
+    firsts = np.full(len(batch_groups), num_strong)
+    if len(rows):
+        heads = np.flatnonzero(np.diff(rows, prepend=-1))
+        firsts[rows[heads]] = np.minimum.reduceat(cols, heads)
+    starts = np.flatnonzero(np.diff(batch_groups, prepend=batch_groups[0] - 1))
+    return starts, np.minimum.reduceat(firsts, starts)
+
+
+def pair_radii(batch_groups, field, rows, cols, fixed_radii=None):
+    """
+    The radius each influencing pair of a batch falls off over.
+
+    The original renderer divided every pair of a batch by a single radius,
+    that of the first strong pixel influencing anything in the batch. Each
+    weak pixel keeps the radius group it had there, given in batch_groups,
+    whatever the batching. Groups with weak pixels outside this batch take
+    their radius from fixed_radii, a {group: radius} dict (see group_radii).
+    """
+    num_strong = len(field['radii'])
+    starts, firsts = _group_firsts(batch_groups, rows, cols, num_strong)
+    # A group without pairs never uses its radius
+    radii = field['radii'][np.minimum(firsts, num_strong - 1)]
+    radii = np.repeat(radii, np.diff(np.append(starts, len(batch_groups))))
+    for group, radius in (fixed_radii or {}).items():
+        radii[batch_groups == group] = radius
+    return radii[rows]
+
+
+def group_radii(weak_indices, weak_coords, groups, field, width, height, engine=DEFAULT_ENGINE, dtype=np.float64):
+    """
+    The {group: radius} of radius groups, given every one of their weak pixels.
+
+    Lets a render that blends one group's pixels in separate apply_influence
+    calls, like the tiled render, fix the group's radius up front. Groups
+    without any influencing pair are left out.
+    """
+    field, index, find_pairs = _prepare_field(field, width, height, engine, dtype)
+    rows, cols, _ = find_pairs(weak_indices, weak_coords, field, index, Scratch())
+    num_strong = len(field['radii'])
+    starts, firsts = _group_firsts(groups, rows, cols, num_strong)
+    return {int(groups[start]): field['radii'][first] for start, first in zip(starts, firsts) if first < num_strong}
+
+
+def blend_batch(hues, saturations, values, batch_weak, field, rows, cols, adjusted_distances, radii):
+    """
+    Blend strong colors into a batch of weak pixels from their influencing pairs.
+
+    Each pair's influence falls off over its radius from pair_radii.
+    """
+    batch_len = len(batch_weak)
+    boosts = field['boosts'][cols]
+
+    # Calculate influences, adjusted by type and strength
+    influences = (1 - (adjusted_distances / radii)) * (1 + boosts * 1.5)
+    influences *= field['type_factors'][cols]
+    influences *= field['strengths'][cols]
+
+    # Calculate weighted colors
+    total_influences = np.bincount(rows, weights=influences, minlength=batch_len)
+    mask = total_influences > 0
+    if not np.any(mask):
+        return
+
+    weighted_hues = np.bincount(rows, weights=influences * field['hues'][cols], minlength=batch_len)[mask] / total_influences[mask]
+    weighted_sats = np.bincount(rows, weights=influences * field['sats'][cols], minlength=batch_len)[mask] / total_influences[mask]
+    weighted_vals = np.bincount(rows, weights=influences * field['vals'][cols], minlength=batch_len)[mask] / total_influences[mask]
+
+    # Calculate blend factors
+    negative = field['is_negative'][cols]
+    neg_influence = np.bincount(rows[negative], weights=influences[negative], minlength=batch_len)
+    pos_influence = np.bincount(rows[~negative], weights=influences[~negative], minlength=batch_len)
+    max_blends = np.where(neg_influence > pos_influence, 0.92, 0.88)
+    blend_factors = np.minimum(total_influences * 1.8, max_blends)[mask]
+
+    # Apply blending
+    targets = batch_weak[mask]
+    hues[targets] = hues[targets] * (1 - blend_factors) + weighted_hues * blend_factors
+    saturations[targets] = saturations[targets] * (1 - blend_factors) + weighted_sats * blend_factors
+    values[targets] = values[targets] * (1 - blend_factors) + weighted_vals * blend_factors
+
+
+def _share_arrays(arrays):
+    """
+    Copy a dict of arrays into shared memory.
+
+    Returns (blocks, specs): the SharedMemory blocks, which the caller must
+    close and unlink, and picklable {name: (block name, shape, dtype)} specs
+    for _attach_arrays.
+    """
+    from multiprocessing import shared_memory
+
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+        _view(block, specs[name])[...] = array
+    return blocks, specs
+
+
+def _view(block, spec):
+    _, shape, dtype = spec
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _attach_arrays(specs):
+    """Map shared-memory specs back to arrays; returns (blocks, arrays)."""
+    from multiprocessing import shared_memory
+
+    blocks, arrays = [], {}
+    for name, spec in specs.items():
+        block = shared_memory.SharedMemory(name=spec[0])
+        blocks.append(block)
+        arrays[name] = _view(block, spec)
+    return blocks, arrays
+
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(specs, engine, cell_size, cells_x, fixed_radii):
+    blocks, arrays = _attach_arrays(specs)
+    field = {name[len('field_'):]: array for name, array in arrays.items() if name.startswith('field_')}
+    index = None
+    if engine == 'grid':
+        index = {'cell_size': cell_size, 'cells_x': cells_x,
+                 'starts': arrays['index_starts'], 'members': arrays['index_members']}
+    _worker.update(blocks=blocks, arrays=arrays, field=field, index=index,
+                   find_pairs=PAIR_FINDERS[engine], scratch=Scratch(), fixed_radii=fixed_radii)
+
+
+def _run_batch(hues, saturations, values, coords, weak_indices, groups, field, find_pairs, index, scratch,
+               fixed_radii, batch_start, batch_end):
+    """Find one batch's influencing pairs and blend them into the HSV arrays."""
+    batch_weak = weak_indices[batch_start:batch_end]
+    rows, cols, adjusted_distances = find_pairs(batch_weak, coords[batch_weak], field, index, scratch)
+    if len(rows) == 0:
+        return
+    radii = pair_radii(groups[batch_start:batch_end], field, rows, cols, fixed_radii)
+    blend_batch(hues, saturations, values, batch_weak, field, rows, cols, adjusted_distances, radii)
+
+
+def _process_batch(batch_start, batch_end):
+    """Pool task: blend one batch of weak pixels into the shared HSV arrays."""
+    arrays = _worker['arrays']
+    _run_batch(arrays['hues'], arrays['saturations'], arrays['values'], arrays['coords'], arrays['weak_indices'],
+               arrays['groups'], _worker['field'], _worker['find_pairs'], _worker['index'], _worker['scratch'],
+               _worker['fixed_radii'], batch_start, batch_end)
+
+
+def _apply_influence_parallel(hues, saturations, values, coords, weak_indices, groups, field,
+                              engine, index, batches, workers, progress=True, fixed_radii=None):
+    """Run the batches on a process pool, with every input and output in shared memory."""
+    arrays = {'hues': hues, 'saturations': saturations, 'values': values,
+              'coords': coords, 'weak_indices': weak_indices, 'groups': groups}
+    arrays.update({f'field_{name}': array for name, array in field.items()})
+    if index is not None:
+        arrays.update(index_starts=index['starts'], index_members=index['members'])
+    cell_size = index['cell_size'] if index is not None else None
+    cells_x = index['cells_x'] if index is not None else None
+
+    from concurrent.futures import ProcessPoolExecutor
+    from tqdm import tqdm
+
+    blocks, specs = _share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(specs, engine, cell_size, cells_x, fixed_radii)) as executor:
+            starts, ends = zip(*batches)
+            for _ in tqdm(executor.map(_process_batch, starts, ends), total=len(batches),
+                          desc="Processing batches", disable=not progress):
+                pass
+
+        # Copy the blended channels back into the caller's arrays
+        for block, (name, spec) in zip(blocks, specs.items()):
+            if name in ('hues', 'saturations', 'values'):
+                arrays[name][...] = _view(block, spec)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _prepare_field(field, width, height, engine, dtype):
+    """Check engine and return (field in dtype, its grid index or None, the engine's pair finder)."""
+    if engine not in PAIR_FINDERS:
+        raise ValueError(f"Unknown influence engine '{engine}', expected one of {ENGINES}")
+    index = build_grid_index(field, width, height) if engine == 'grid' else None
+
+    # Work on the strong-pixel floats in the requested precision
+    field = {name: array.astype(dtype, copy=False) if array.dtype.kind == 'f' else array
+             for name, array in field.items()}
+    return field, index, PAIR_FINDERS[engine]
+
+
+def apply_influence(hues, saturations, values, coords, width, height, weak_indices, field,
+                    engine=DEFAULT_ENGINE, max_bytes=DEFAULT_MAX_BYTES, workers=1, dtype=np.float64,
+                    progress=True, groups=None, fixed_radii=None):
+    """
+    Bleed strong pixel colors into the weak pixels, updating the HSV arrays in place.
+
+    groups gives each weak pixel's radius group (see pair_radii), by default
+    consecutive runs of RADIUS_GROUP_SIZE as in the original renderer; a
+    group only partly in weak_indices needs its radius in fixed_radii.
+    Batches are sized from each weak pixel's candidate pair count: they aim
+    for BATCH_BYTES of pairwise temporaries and never exceed max_bytes split
+    evenly across workers, except that a batch always holds whole groups.
+    Pair distances and blend weights are computed in dtype; float32 halves
+    their memory at the cost of output that can differ slightly from the
+    float64 default. With workers > 1 the batches run on that many
+    processes; the output is identical to the serial run. progress=False
+    hides the progress bar.
+    """
+    field, index, find_pairs = _prepare_field(field, width, height, engine, dtype)
+    if groups is None:
+        groups = np.arange(len(weak_indices)) // RADIUS_GROUP_SIZE
+
+    counts = candidate_counts(coords[weak_indices], field, engine, index)
+    # Each weak pixel also carries a few per-pixel arrays (cells, sums, blend factors)
+    costs = counts * candidate_bytes(engine, dtype) + 16 * 8
+    batches = group_batches(groups, costs, min(BATCH_BYTES, max_bytes // max(workers, 1)))
+
+    workers = min(workers, len(batches))
+    if workers > 1:
+        _apply_influence_parallel(hues, saturations, values, coords, weak_indices, groups, field,
+                                  engine, index, batches, workers, progress, fixed_radii)
+        return
+
+    from tqdm import tqdm
+
+    scratch = Scratch()
+    for batch_start, batch_end in tqdm(batches, desc="Processing batches", disable=not progress):
+        _run_batch(hues, saturations, values, coords, weak_indices, groups, field, find_pairs, index, scratch,
+                   fixed_radii, batch_start, batch_end)
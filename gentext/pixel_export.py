@@ -0,0 +1,166 @@
+"""
+Binary pixel-data format for the web visualization.
+
+Layout (little-endian):
+
+    offset  size        field
+    0       4           magic b'PXD1'
+    4       4           uint32 width
+    8       4           uint32 height
+    12      4           uint32 pixel count (width * height)
+    16      4           uint32 collapsible pixel count
+    20      count * 3   RGB bytes in raster order
+    ...     ceil(count / 8)
+                        collapsible bitmask, bit i % 8 of byte i // 8 (LSB first)
+
+The page reads it with a single fetch() and views over the ArrayBuffer,
+instead of downloading and parsing one JSON object per pixel.
+
+Run as a script to convert an existing pixel_data.json:
+
+    python pixel_export.py pixel_data.json pixel_data.bin
+"""
+import json
+import re
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'PXD1'
+HEADER = struct.Struct('<4s4I')
+
+
+def extract_pixels(rendered_rgb, width, height, white_threshold):
+    """
+    Lay a render's RGB rows out on the full grid and flag near-white pixels.
+
+    rendered_rgb holds one row per word and may be shorter than the grid; the
+    remaining pixels are black. Returns (rgb, collapsible): the padded
+    (width * height, 3) uint8 array and a boolean mask of pixels whose
+    channels all exceed white_threshold.
+    """
+    rgb = np.zeros((width * height, 3), dtype=np.uint8)
+    rgb[:len(rendered_rgb)] = rendered_rgb
+    collapsible = np.all(rgb > white_threshold, axis=1)
+    return rgb, collapsible
+
+
+def _json_pixel_list(rgb, indices, width):
+    """Render pixel objects as JSON text, formatted like json.dump, without per-pixel dicts."""
+    if len(indices) == 0:
+        return '[]'
+    channels = [rgb[indices, channel].astype(str) for channel in range(3)]
+    entries = np.char.add('{"color": "rgb(', channels[0])
+    entries = np.char.add(np.char.add(entries, ','), channels[1])
+    entries = np.char.add(np.char.add(entries, ','), channels[2])
+    entries = np.char.add(np.char.add(entries, ')", "x": '), (indices % width).astype(str))
+    entries = np.char.add(np.char.add(entries, ', "y": '), (indices // width).astype(str))
+    entries = np.char.add(entries, '}')
+    return '[' + ', '.join(entries.tolist()) + ']'
+
+
+def write_json(path, rgb, width, height, collapsible):
+    """Write pixels as the legacy pixel_data.json, taking the same arrays as write_binary."""
+    rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    all_indices = np.arange(width * height)
+    dimensions = json.dumps({'width': width, 'height': height})
+
+    with open(path, 'w') as f:
+        f.write('{"allPixels": ')
+        f.write(_json_pixel_list(rgb, all_indices, width))
+        f.write(', "collapsedPixels": ')
+        f.write(_json_pixel_list(rgb, np.flatnonzero(collapsible), width))
+        # Collapsed pixels keep their original coordinates, so both use the standard dimensions
+        f.write(f', "standardDimensions": {dimensions}, "collapsedDimensions": {dimensions}}}')
+
+
+def write_binary(path, rgb, width, height, collapsible):
+    """
+    Write pixels in the binary format.
+
+    rgb is a (width * height, 3) uint8 array in raster order and collapsible a
+    boolean mask over the same pixels.
+    """
+    rgb = np.ascontiguousarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    collapsible = np.asarray(collapsible, dtype=bool)
+    count = width * height
+    if len(rgb) != count or len(collapsible) != count:
+        raise ValueError(f"Expected {count} pixels for a {width}x{height} image, got {len(rgb)}")
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, width, height, count, int(collapsible.sum())))
+        f.write(rgb.tobytes())
+        f.write(np.packbits(collapsible, bitorder='little').tobytes())
+
+
+def patch_binary(path, rgb, width, height, collapsible, indices):
+    """
+    Rewrite only the given pixels of an existing binary pixel file in place.
+
+    Takes the same arrays as write_binary plus the indices of the pixels that
+    changed; the file must already hold a width x height image.
+    """
+    rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    count = width * height
+    data = np.memmap(path, dtype=np.uint8, mode='r+')
+    try:
+        magic, stored_width, stored_height, _, _ = HEADER.unpack_from(data)
+        if magic != MAGIC or (stored_width, stored_height) != (width, height):
+            raise ValueError(f"{path} does not hold a {width}x{height} pixel file")
+
+        data[HEADER.size:HEADER.size + count * 3].reshape(-1, 3)[indices] = rgb[indices]
+        # Each changed pixel rewrites the mask byte holding its bit
+        mask = np.packbits(collapsible, bitorder='little')
+        mask_bytes = np.unique(np.asarray(indices) // 8)
+        data[HEADER.size + count * 3 + mask_bytes] = mask[mask_bytes]
+        HEADER.pack_into(data, 0, MAGIC, width, height, count, int(np.count_nonzero(collapsible)))
+        data.flush()
+    finally:
+        del data
+
+
+EXPORT_FORMATS = {
+    'binary': ('pixel_data.bin', write_binary),
+    'json': ('pixel_data.json', write_json),
+}
+
+
+def read_binary(path):
+    """Read a binary pixel file back as (rgb, width, height, collapsible)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, width, height, count, _ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a binary pixel file")
+    rgb = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=HEADER.size).reshape(-1, 3)
+    mask_bytes = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size + count * 3)
+    collapsible = np.unpackbits(mask_bytes, count=count, bitorder='little').astype(bool)
+    return rgb, width, height, collapsible
+
+
+def convert_json(json_path, binary_path):
+    """Convert a pixel_data.json export to the binary format."""
+    with open(json_path) as f:
+        data = json.load(f)
+
+    width = data['standardDimensions']['width']
+    height = data['standardDimensions']['height']
+    rgb = np.zeros((width * height, 3), dtype=np.uint8)
+    for pixel in data['allPixels']:
+        rgb[pixel['y'] * width + pixel['x']] = [int(c) for c in re.findall(r'\d+', pixel['color'])]
+
+    collapsible = np.zeros(width * height, dtype=bool)
+    for pixel in data['collapsedPixels']:
+        collapsible[pixel['y'] * width + pixel['x']] = True
+
+    write_binary(binary_path, rgb, width, height, collapsible)
+    print(f"Converted {json_path} to {binary_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python pixel_export.py pixel_data.json pixel_data.bin")
+        sys.exit(1)
+    convert_json(sys.argv[1], sys.argv[2])
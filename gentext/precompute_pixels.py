@@ -1,63 +1,75 @@
-import json
+import argparse
 from text_to_image import *
 import colorsys
+from pixel_export import EXPORT_FORMATS, extract_pixels, patch_binary
 
-def main():
-    print("Loading and processing text...")
-    
-    # Load and process text
-    text = load_text('text.txt')
-    words = preprocess_text(text)
-    
-    # Analyze sentiment
-    sentiments, raw_scores = analyze_sentiment(words)
-    unique_sentiments = unique_sentiment_assignment(words, sentiments)
-    enhanced_unique_sentiments = enhance_sentiment_diversity(unique_sentiments)
+WHITE_THRESHOLD = 200  # RGB values must be > 200 to be considered "close to white"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute pixel data for the web visualization.")
+    parser.add_argument('source', nargs='?', default='text.txt', help="UTF-8 text file or PDF to render")
+    add_render_arguments(parser, images=False)
+    parser.add_argument('--profile', metavar='REPORT',
+                        help="write per-stage time and memory to REPORT (.json or .csv)")
+    parser.add_argument('--format', choices=('binary', 'json'), default='binary',
+                        help="pixel_data.bin (see pixel_export.py) or the legacy pixel_data.json")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only re-render what changed since the last --incremental run over SOURCE, "
+                             "patching the binary export in place when its size is unchanged")
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count()
+    dtype = np.float32 if args.float32 else np.float64
+    profiler = Profiler(enabled=bool(args.profile))
     
-    # Analyze word features
-    original_features = analyze_word_features(words)
+    print("Loading and processing text...")
     
-    # Create standard visualization first
-    img_standard, width_standard, height_standard = create_multi_feature_image(words, enhanced_unique_sentiments, original_features)
-    pixels_standard = img_standard.load()
+    path, write = EXPORT_FORMATS[args.format]
+    if args.incremental:
+        # Diff against the previous run's snapshot instead of the stage cache
+        snapshot = snapshot_path(args.source, f'precompute_pixels-{args.format}')
+        params = incremental_params(args.sentiment, dtype)
+        previous = load_snapshot(snapshot, params)
+        words, enhanced_unique_sentiments, original_features, vocab_scores, context = incremental_render_context(
+            args.source, previous, use_cache=not args.no_cache, profiler=profiler, sentiment_backend=args.sentiment,
+            workers=workers, max_bytes=args.max_memory * 2**20, dtype=dtype)
+    else:
+        # Load, analyze and render, reusing any cached stages
+        cache = StageCache(enabled=not args.no_cache)
+        words, enhanced_unique_sentiments, original_features, key = analyze_text(args.source, cache, profiler,
+                                                                                 args.sentiment)
+        
+        # Create standard visualization first
+        context = cached_render_context(words, enhanced_unique_sentiments, original_features, key, cache,
+                                        workers=workers, max_bytes=args.max_memory * 2**20, dtype=dtype,
+                                        profiler=profiler)
+    width_standard, height_standard = context.width, context.height
     
-    # Extract all pixel data and identify collapsible pixels (close to white)
-    all_pixels = []
-    collapsed_pixels = []
-    WHITE_THRESHOLD = 200  # RGB values must be > 200 to be considered "close to white"
+    with profiler.stage('export', items=width_standard * height_standard):
+        # Extract all pixel data and identify collapsible pixels (close to white)
+        rgb, collapsible = extract_pixels(context.rgb, width_standard, height_standard, WHITE_THRESHOLD)
+        
+        # The previous export can be patched if it is still the one written from the snapshot
+        patchable = (args.incremental and args.format == 'binary' and previous is not None
+                     and (previous['width'], previous['height']) == (width_standard, height_standard)
+                     and os.path.exists(path) and file_key(path) == previous['export_key'])
+        if patchable:
+            common = min(len(context.hsv), len(previous['hsv']))
+            changed = np.flatnonzero(np.any(context.hsv[:common] != previous['hsv'][:common], axis=1))
+            changed = np.concatenate((changed, np.arange(common, max(len(context.hsv), len(previous['hsv'])))))
+            patch_binary(path, rgb, width_standard, height_standard, collapsible, changed)
+            print(f"Patched {len(changed)} changed pixels in {path}")
+        else:
+            write(path, rgb, width_standard, height_standard, collapsible)
     
-    for y in range(height_standard):
-        for x in range(width_standard):
-            r, g, b = pixels_standard[x, y]
-            all_pixels.append({
-                'color': f'rgb({r},{g},{b})',
-                'x': x,
-                'y': y
-            })
-            # Check if pixel is close to white
-            if r > WHITE_THRESHOLD and g > WHITE_THRESHOLD and b > WHITE_THRESHOLD:
-                collapsed_pixels.append({
-                    'color': f'rgb({r},{g},{b})',
-                    'x': x,
-                    'y': y
-                })
+    print(f"Saved {len(rgb)} total pixels and {collapsible.sum()} collapsed pixels to {path}")
     
-    # Save to JSON
-    with open('pixel_data.json', 'w') as f:
-        json.dump({
-            'allPixels': all_pixels,
-            'collapsedPixels': collapsed_pixels,
-            'standardDimensions': {
-                'width': width_standard,
-                'height': height_standard
-            },
-            'collapsedDimensions': {
-                'width': width_standard,  # Use standard dimensions since we're keeping original coordinates
-                'height': height_standard
-            }
-        }, f)
+    if args.incremental:
+        save_snapshot(snapshot, params, words.vocab, words.token_ids, vocab_scores, original_features.table,
+                      enhanced_unique_sentiments, context.hsv, width_standard, height_standard, file_key(path))
     
-    print(f"Saved {len(all_pixels)} total pixels and {len(collapsed_pixels)} collapsed pixels to pixel_data.json")
+    if args.profile:
+        print("\n" + profiler.summary())
+        profiler.write(args.profile, script='precompute_pixels', format=args.format, source=args.source)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
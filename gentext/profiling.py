@@ -0,0 +1,122 @@
+"""
+Per-stage timing and memory profiling for the pipeline.
+
+Each stage records its wall time, CPU time (including worker processes that
+finished during it), peak resident memory and an item count, and the run can
+be written out as a JSON or CSV report:
+
+    python text_to_image.py --profile profile.json
+    python precompute_pixels.py --profile profile.csv
+
+On Linux the peak RSS is reset at the start of every stage, so it is the peak
+within that stage; on other POSIX systems it is the process's peak so far.
+Without the POSIX resource module (on Windows) CPU time is the main process's
+alone and peak_rss_mb is None.
+"""
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_FIELDS = ('stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'items', 'cached')
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS counter for this process, if the platform allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+def _cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class Profiler:
+    """Collects one record per pipeline stage; a disabled profiler records nothing."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """
+        Measure the enclosed block as stage name.
+
+        Yields the stage's record, so the block can fill in 'items' or
+        'cached' once it knows them.
+        """
+        record = {'stage': name, 'items': items, 'cached': None}
+        if not self.enabled:
+            yield record
+            return
+
+        _reset_peak_rss()
+        wall = time.perf_counter()
+        cpu = _cpu_seconds()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = _cpu_seconds() - cpu
+            peak = _peak_rss_bytes()
+            record['peak_rss_mb'] = None if peak is None else peak / 2**20
+            self.records.append(record)
+
+    def report(self):
+        """The records as a list of dicts with every REPORT_FIELDS key."""
+        return [{field: record.get(field) for field in REPORT_FIELDS} for record in self.records]
+
+    def summary(self):
+        """A plain-text table of the records."""
+        lines = [f"{'stage':<22}{'wall s':>9}{'cpu s':>9}{'peak MB':>10}{'items':>10}"]
+        for record in self.report():
+            items = '' if record['items'] is None else record['items']
+            cached = ' (cached)' if record['cached'] else ''
+            peak = 'n/a' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.1f}"
+            lines.append(f"{record['stage']:<22}{record['wall_s']:>9.3f}{record['cpu_s']:>9.3f}"
+                         f"{peak:>10}{items:>10}{cached}")
+        return '\n'.join(lines)
+
+    def write(self, path, **metadata):
+        """Write the report as CSV if path ends in .csv, otherwise as JSON with metadata."""
+        if os.path.splitext(path)[1].lower() == '.csv':
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.report())
+        else:
+            with open(path, 'w') as f:
+                json.dump({**metadata, 'stages': self.report()}, f, indent=2)
+        print(f"Wrote profile to {path}")
@@ -0,0 +1,286 @@
+"""
+Per-vocabulary sentiment scoring with a persistent word score cache.
+
+Scores come from a sentiment backend: any object with a
+polarity_scores(word) method returning a dict of SCORE_FIELDS, optionally a
+vectorized score_words(words) returning a SCORE_DTYPE array, and optionally a
+lexicon_version string. SENTIMENT_BACKENDS names the built-in ones:
+
+- lexicon: VADER's single-word scores compiled ahead of time into
+           vader_lexicon.npy, a sorted array that is memory-mapped and looked
+           up with a binary search (needs neither nltk nor the network)
+- vader:   NLTK's SentimentIntensityAnalyzer
+
+Scores from backends without score_words are cached on disk in SQLite, keyed
+by lexicon version, so repeated runs (and runs over books with overlapping
+vocabularies) only score words they haven't seen before. The compiled lexicon
+looks words up faster than the cache, so it skips it.
+
+Run as a script to recompile vader_lexicon.npy from the installed NLTK lexicon:
+
+    python sentiment.py
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from stage_cache import CACHE_DIR
+
+SCORE_FIELDS = ('compound', 'pos', 'neg', 'neu')
+SCORE_DTYPE = np.dtype([(field, np.float64) for field in SCORE_FIELDS])
+
+COMPILED_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vader_lexicon.npy')
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'sentiment_scores.sqlite')
+DEFAULT_MAX_ENTRIES = 500_000
+
+# SQLite caps the number of bound parameters per statement
+_QUERY_CHUNK = 500
+
+# The shared VADER analyzer, loaded by vader_analyzer on first use
+_vader = None
+
+
+class LexiconUnavailableError(RuntimeError):
+    """The sentiment lexicon isn't installed; it is never downloaded implicitly."""
+
+
+def vader_analyzer():
+    """
+    The NLTK VADER analyzer, created on first use.
+
+    Importing nltk is slow, so it is deferred until sentiment is actually
+    needed. Nothing is downloaded: a missing lexicon raises
+    LexiconUnavailableError with the command that installs it.
+    """
+    global _vader
+    if _vader is None:
+        try:
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+        except ImportError:
+            raise LexiconUnavailableError("Sentiment analysis requires nltk: pip install nltk") from None
+        try:
+            _vader = SentimentIntensityAnalyzer()
+        except LookupError:
+            raise LexiconUnavailableError(
+                "The VADER lexicon is not installed. Download it once with:\n"
+                "    python -m nltk.downloader vader_lexicon") from None
+    return _vader
+
+
+class CompiledLexicon:
+    """
+    Single-word VADER scores from a precompiled, memory-mapped lexicon.
+
+    The file is a structured array sorted by its 'word' field (lowercase
+    UTF-8 bytes) holding each lexicon word's VADER scores. For a single token,
+    VADER scores nothing at all for one-character tokens, looks the lowercased
+    token up otherwise and treats unknown words as neutral, so the scores
+    match SentimentIntensityAnalyzer.polarity_scores for every token without
+    whitespace.
+    """
+
+    def __init__(self, path=COMPILED_LEXICON_PATH):
+        self.path = path
+        self.entries = np.load(path, mmap_mode='r')
+        with open(path, 'rb') as f:
+            self.lexicon_version = f"compiled-{hashlib.sha256(f.read()).hexdigest()[:16]}"
+
+    def score_words(self, words):
+        """Scores for a list of words as a SCORE_DTYPE array aligned with words."""
+        scores = np.zeros(len(words), dtype=SCORE_DTYPE)
+        if not len(words):
+            return scores
+        keys = self.entries['word']
+        encoded = [word.lower().encode('utf-8') for word in words]
+        lengths = np.array([len(word) for word in words])
+        fits = np.array([len(key) <= keys.itemsize for key in encoded])
+        lookup = np.array(encoded, dtype=keys.dtype)
+
+        positions = np.minimum(np.searchsorted(keys, lookup), len(keys) - 1)
+        found = fits & (keys[positions] == lookup)
+
+        # Words VADER keeps but doesn't know are neutral; single characters score nothing
+        scores['neu'] = lengths > 1
+        for field in SCORE_FIELDS:
+            scores[field][found] = self.entries[field][positions[found]]
+        return scores
+
+    def polarity_scores(self, word):
+        return dict(zip(SCORE_FIELDS, self.score_words([word])[0].tolist()))
+
+
+def compile_lexicon(analyzer, path=COMPILED_LEXICON_PATH):
+    """
+    Compile a VADER analyzer's single-word scores into a CompiledLexicon file.
+
+    Each lexicon word without whitespace is scored with the analyzer itself,
+    so rules VADER applies to lone words (booster words score as neutral,
+    for instance) are baked into the stored scores.
+    """
+    words = sorted({word.lower() for word in analyzer.lexicon if not any(c.isspace() for c in word)},
+                   key=lambda word: word.encode('utf-8'))
+    width = max(len(word.encode('utf-8')) for word in words)
+    entries = np.zeros(len(words), dtype=[('word', f'S{width}')] + SCORE_DTYPE.descr)
+    entries['word'] = [word.encode('utf-8') for word in words]
+    for i, word in enumerate(words):
+        score = analyzer.polarity_scores(word)
+        for field in SCORE_FIELDS:
+            entries[field][i] = score[field]
+    np.save(path, entries)
+    print(f"Compiled {len(entries)} lexicon words to {path}")
+
+
+SENTIMENT_BACKENDS = {
+    'lexicon': CompiledLexicon,
+    'vader': vader_analyzer,
+}
+DEFAULT_SENTIMENT_BACKEND = 'lexicon'
+
+
+def load_backend(name=DEFAULT_SENTIMENT_BACKEND):
+    """Create the sentiment backend registered under name in SENTIMENT_BACKENDS."""
+    if name not in SENTIMENT_BACKENDS:
+        raise ValueError(f"Unknown sentiment backend '{name}', expected one of {tuple(SENTIMENT_BACKENDS)}")
+    return SENTIMENT_BACKENDS[name]()
+
+
+def lexicon_version(analyzer):
+    """
+    Identify the lexicon and scoring rules behind analyzer.
+
+    Analyzers can provide a lexicon_version attribute; otherwise the VADER
+    lexicon text is hashed together with the NLTK version.
+    """
+    version = getattr(analyzer, 'lexicon_version', None)
+    if version is not None:
+        return version
+
+    import nltk
+    digest = hashlib.sha256(analyzer.lexicon_file.encode('utf-8')).hexdigest()[:16]
+    return f"{type(analyzer).__name__}-nltk{nltk.__version__}-{digest}"
+
+
+class SentimentCache:
+    """SQLite-backed word -> (compound, pos, neg, neu) cache with LRU eviction."""
+
+    def __init__(self, version, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.version = version
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            " version TEXT NOT NULL, word TEXT NOT NULL,"
+            " compound REAL, pos REAL, neg REAL, neu REAL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (version, word))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)")
+
+    def lookup(self, words):
+        """
+        Fetch cached scores for a list of distinct words.
+
+        Returns (scores, found): a SCORE_DTYPE array aligned with words and a
+        boolean mask of which words were in the cache. Hits are marked as
+        recently used.
+        """
+        positions = {word: i for i, word in enumerate(words)}
+        scores = np.zeros(len(words), dtype=SCORE_DTYPE)
+        found = np.zeros(len(words), dtype=bool)
+
+        for start in range(0, len(words), _QUERY_CHUNK):
+            chunk = words[start:start + _QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT word, compound, pos, neg, neu FROM scores"
+                f" WHERE version = ? AND word IN ({placeholders})",
+                [self.version, *chunk],
+            )
+            for word, *values in rows:
+                scores[positions[word]] = tuple(values)
+                found[positions[word]] = True
+
+        hits = [(time.time(), self.version, word) for word, i in positions.items() if found[i]]
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE scores SET last_used = ? WHERE version = ? AND word = ?", hits)
+        return scores, found
+
+    def store(self, words, scores):
+        """Add scores for words, evicting the least recently used entries beyond max_entries."""
+        now = time.time()
+        rows = [(self.version, word, *(float(value) for value in score), now)
+                for word, score in zip(words, scores.tolist())]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scores (version, word, compound, pos, neg, neu, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries, across all lexicon versions, beyond max_entries."""
+        excess = self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM scores WHERE rowid IN"
+                " (SELECT rowid FROM scores ORDER BY last_used LIMIT ?)", (excess,))
+
+    def close(self):
+        self.connection.close()
+
+
+def score_vocabulary(vocab, analyzer, cache=None):
+    """
+    Score each distinct word once with analyzer, a sentiment backend.
+
+    Returns a structured array aligned with vocab, with one float field per
+    entry of SCORE_FIELDS. With a SentimentCache, cached words are not
+    re-scored and newly scored words are added to the cache.
+    """
+    if cache is None:
+        scores = np.zeros(len(vocab), dtype=SCORE_DTYPE)
+        missing = np.arange(len(vocab))
+    else:
+        scores, found = cache.lookup(vocab)
+        missing = np.flatnonzero(~found)
+
+    missing_words = [vocab[i] for i in missing]
+    if hasattr(analyzer, 'score_words'):
+        computed = analyzer.score_words(missing_words)
+    else:
+        computed = []
+        for word in missing_words:
+            score = analyzer.polarity_scores(word)
+            computed.append(tuple(score[field] for field in SCORE_FIELDS))
+        computed = np.array(computed, dtype=SCORE_DTYPE)
+    scores[missing] = computed
+
+    if cache is not None and len(missing_words):
+        cache.store(missing_words, computed)
+    return scores
+
+
+def score_words_cached(vocab, backend=DEFAULT_SENTIMENT_BACKEND, use_cache=True):
+    """
+    score_vocabulary with the backend named backend, through the persistent SentimentCache if use_cache.
+
+    Backends with a vectorized score_words, like the compiled lexicon, look
+    words up faster than the cache can, so they never use it.
+    """
+    analyzer = load_backend(backend)
+    use_cache = use_cache and not hasattr(analyzer, 'score_words')
+    cache = SentimentCache(lexicon_version(analyzer)) if use_cache else None
+    try:
+        return score_vocabulary(vocab, analyzer, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    compile_lexicon(vader_analyzer())
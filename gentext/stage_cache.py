@@ -0,0 +1,93 @@
+"""
+Content-addressed memoization of pipeline stages.
+
+Each stage's output is a dict of NumPy arrays stored as one .npz file. Its key
+hashes the stage name, the key of the stage it consumes and the stage's own
+parameters, so keys chain from the hash of the input text down to the final
+render: changing a parameter only invalidates that stage and the ones after it.
+"""
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+# Every on-disk cache of the pipeline lives under here
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+STAGE_CACHE_DIR = os.path.join(CACHE_DIR, 'stages')
+
+# Bump to invalidate every cached stage after an incompatible change
+CACHE_FORMAT = 1
+
+
+def file_key(file_path, chunk_size=1 << 20):
+    """Key for an input file: a hash of its bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for data in iter(lambda: file.read(chunk_size), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Yield a temporary path to write path's new contents to.
+
+    The file is moved over path only once the block finishes, so a crash never
+    leaves a truncated file behind. The temporary path keeps path's extension,
+    so np.savez writes to it as is.
+    """
+    root, extension = os.path.splitext(path)
+    temporary = f"{root}.{os.getpid()}.tmp{extension}"
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def stage_key(name, upstream, params=None):
+    """Key for a stage's output, chained from its upstream key."""
+    description = json.dumps([CACHE_FORMAT, name, upstream, params or {}], sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """Directory of memoized stage outputs."""
+
+    def __init__(self, directory=STAGE_CACHE_DIR, enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+        # Whether the last run() was served from disk
+        self.hit = False
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, name, key):
+        return os.path.join(self.directory, f"{name}-{key[:32]}.npz")
+
+    def run(self, name, upstream, params, compute):
+        """
+        Return (key, arrays) for a stage, calling compute() only on a cache miss.
+
+        compute must return a dict of NumPy arrays without object dtypes.
+        """
+        key = stage_key(name, upstream, params)
+        self.hit = False
+        if not self.enabled:
+            return key, compute()
+
+        path = self.path(name, key)
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                print(f"Using cached {name} stage")
+                self.hit = True
+                return key, {field: stored[field] for field in stored.files}
+
+        arrays = compute()
+        with atomic_write(path) as temporary:
+            np.savez(temporary, **arrays)
+        return key, arrays
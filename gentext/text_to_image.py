@@ -1,35 +1,27 @@
-import nltk
 import numpy as np
-from PIL import Image
 import math
+import os
+import argparse
 import re
 import sys
 import colorsys
 import random
 import hashlib
-import string
 from collections import defaultdict
-from tqdm import tqdm
-
-# Download the VADER lexicon for sentiment analysis with error handling
-try:
-    nltk.download('vader_lexicon', quiet=True)
-    from nltk.sentiment.vader import SentimentIntensityAnalyzer
-except LookupError as e:
-    print("Error downloading VADER lexicon:")
-    print(e)
-    print("\nPlease run the following commands in a Python shell:")
-    print(">>> import nltk")
-    print(">>> nltk.download('vader_lexicon')")
-    sys.exit(1)
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
-    sys.exit(1)
+import colorspace
+import influence
+from sentiment import DEFAULT_SENTIMENT_BACKEND, SCORE_DTYPE, SENTIMENT_BACKENDS, score_words_cached
+from image_writer import DEFAULT_COMPRESSION, open_image, write_image
+from incremental import changed_span, load_snapshot, save_snapshot, snapshot_path, vocabulary_mapping
+from stage_cache import StageCache, file_key
+from documents import read_document_chunks
+from profiling import Profiler
+from features import FEATURE_COLUMNS, WordFeatures, feature_column, vocabulary_features, word_features_for
+from tokens import TokenSequence, build_vocabulary, pack_vocabulary, tokenize_chunks, unpack_vocabulary
 
 def load_text(file_path):
-    """Load text from a file."""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+    """Load text from a UTF-8 text file or a PDF."""
+    return ''.join(read_document_chunks(file_path))
 
 def preprocess_text(text):
     """Split text into words and remove punctuation."""
@@ -39,32 +31,30 @@ def preprocess_text(text):
     words = re.findall(r'\b\w+\b', text.lower())
     return words
 
-def analyze_sentiment(words):
-    """Analyze sentiment of each word."""
-    sia = SentimentIntensityAnalyzer()
-    sentiments = []
-    raw_scores = []
-    
-    # Get sentiment for each word
-    for word in words:
-        score = sia.polarity_scores(word)
-        # Use compound score which is a normalized score between -1 and 1
-        sentiments.append(score['compound'])
-        
-        # Store the component scores too (useful for debugging)
-        raw_scores.append({
-            'word': word,
-            'compound': score['compound'],
-            'pos': score['pos'],
-            'neg': score['neg'],
-            'neu': score['neu']
-        })
+def analyze_sentiment(words, use_cache=True, backend=DEFAULT_SENTIMENT_BACKEND):
+    """
+    Analyze sentiment of each word.
+    
+    Each distinct word is scored once and the scores are gathered back to every
+    occurrence, so this returns NumPy arrays: the compound scores (normalized
+    between -1 and 1) and a structured array of all component scores
+    (compound, pos, neg, neu) per word.
+    
+    Words are scored by the sentiment backend named backend (see
+    SENTIMENT_BACKENDS in sentiment.py); the default compiled lexicon needs
+    neither nltk nor the network. With use_cache, a backend that scores words
+    one at a time (vader) reads and adds word scores through the persistent
+    cache in .cache/, so only unseen words are scored.
+    """
+    vocab, token_ids = build_vocabulary(words)
+    raw_scores = score_words_cached(vocab, backend, use_cache)[token_ids]
+    sentiments = raw_scores['compound']
     
     # Print some statistics for debugging
     print("\nSentiment score statistics:")
-    print(f"Range: {min(sentiments)} to {max(sentiments)}")
-    print(f"Number of unique scores: {len(set(sentiments))}")
-    zero_count = sum(1 for s in sentiments if s == 0)
+    print(f"Range: {sentiments.min()} to {sentiments.max()}")
+    print(f"Number of unique scores: {len(np.unique(sentiments))}")
+    zero_count = np.count_nonzero(sentiments == 0)
     print(f"Words with zero sentiment: {zero_count} ({zero_count/len(sentiments):.1%} of total)")
     
     # Print a few examples of words with their scores
@@ -106,62 +96,79 @@ def enhance_sentiment_diversity(sentiments):
     
     return enhanced
 
+def stable_word_hash(word):
+    """A per-word value in [0, 1) that, unlike hash(), is the same in every process."""
+    return int.from_bytes(hashlib.md5(word.encode()).digest()[:8], 'little') % 1000 / 1000
+
+def sentiment_groups(sentiments, threshold=0.05):
+    """
+    Split sentiments into groups of consecutive similar values.
+    
+    A group runs until a value differs from the group's first value by more
+    than threshold. Returns (starts, lengths) of the groups.
+    """
+    sentiments = np.asarray(sentiments, dtype=np.float64)
+    if len(sentiments) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    
+    # A group can only start where the value changes, so scan runs of equal values
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(sentiments)) + 1))
+    starts = []
+    anchor = None
+    for start, value in zip(run_starts.tolist(), sentiments[run_starts].tolist()):
+        if anchor is None or abs(value - anchor) > threshold:
+            starts.append(start)
+            anchor = value
+    
+    starts = np.array(starts, dtype=np.int64)
+    lengths = np.diff(np.append(starts, len(sentiments)))
+    return starts, lengths
+
 def unique_sentiment_assignment(words, sentiments):
     """
     Make neutral words more unique by assigning them a gradient of values
     or using word-specific characteristics to create pseudo-sentiments.
     """
-    improved_sentiments = []
-    
-    # Group similar sentiment words to track consecutive neutral words
-    groups = []
-    current_group = []
-    current_sentiment = None
-    
-    # First, group words by similar sentiment
-    for i, (word, sentiment) in enumerate(zip(words, sentiments)):
-        # Use a very small threshold to consider sentiments as "same"
-        if current_sentiment is None or abs(sentiment - current_sentiment) > 0.05:
-            if current_group:
-                groups.append((current_group, current_sentiment))
-            current_group = [i]
-            current_sentiment = sentiment
-        else:
-            current_group.append(i)
+    sentiments = np.asarray(sentiments, dtype=np.float64)
+    improved_sentiments = sentiments.copy()
     
-    # Add the last group
-    if current_group:
-        groups.append((current_group, current_sentiment))
+    # Group words by similar sentiment, keeping nearly neutral groups of several words
+    starts, lengths = sentiment_groups(sentiments)
+    group_sentiments = sentiments[starts]
+    spread_groups = (np.abs(group_sentiments) < 0.1) & (lengths > 1)
+    starts = starts[spread_groups]
+    lengths = lengths[spread_groups]
+    if len(starts) == 0:
+        return improved_sentiments
     
-    # Start with original sentiment values
-    improved_sentiments = sentiments.copy()
+    # Position of every word inside its group
+    group_of_word = np.repeat(np.arange(len(starts)), lengths)
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    word_indices = starts[group_of_word] + positions
+    
+    # Spread these neutral words across a small range to create variety
+    spread = 0.2  # The range to spread across
+    base = group_sentiments[spread_groups][group_of_word] - spread/2  # Center the spread around the original sentiment
+    
+    # Per-word hash and linguistic features, computed once per distinct word
+    vocab, token_ids = build_vocabulary(words)
+    word_hashes = np.array([stable_word_hash(word) for word in vocab])
+    vowel_ratios = np.array([sum(1 for c in word if c.lower() in 'aeiou') / (len(word) or 1) for word in vocab])
+    length_factors = np.array([min(len(word) / 10, 1.0) for word in vocab])
+    group_token_ids = token_ids[word_indices]
+    
+    # Option 1: Gradient across the group
+    gradient_values = base + (positions / (lengths[group_of_word] - 1)) * spread
+    
+    # Option 2: Use word hash for a pseudo-random but consistent value
+    hash_values = base + word_hashes[group_token_ids] * spread
+    
+    # Option 3: Use linguistic features
+    feature_values = base + ((vowel_ratios[group_token_ids] + length_factors[group_token_ids]) / 2) * spread
+    
+    # Combine approaches: 60% gradient, 20% hash, 20% features
+    improved_sentiments[word_indices] = 0.6 * gradient_values + 0.2 * hash_values + 0.2 * feature_values
     
-    # Process each group
-    for group_indices, sentiment in groups:
-        # If it's a nearly neutral sentiment and there are multiple words
-        if abs(sentiment) < 0.1 and len(group_indices) > 1:
-            # Spread these neutral words across a small range to create variety
-            spread = 0.2  # The range to spread across
-            base = sentiment - spread/2  # Center the spread around the original sentiment
-            
-            for idx, word_idx in enumerate(group_indices):
-                word = words[word_idx]
-                
-                # Option 1: Gradient across the group
-                gradient_value = base + (idx / (len(group_indices) - 1 or 1)) * spread
-                
-                # Option 2: Use word hash for a pseudo-random but consistent value
-                word_hash = hash(word) % 1000 / 1000
-                hash_value = base + word_hash * spread
-                
-                # Option 3: Use linguistic features
-                vowel_ratio = sum(1 for c in word if c.lower() in 'aeiou') / (len(word) or 1)
-                length_factor = min(len(word) / 10, 1.0)
-                feature_value = base + ((vowel_ratio + length_factor) / 2) * spread
-                
-                # Combine approaches: 60% gradient, 20% hash, 20% features
-                improved_sentiments[word_idx] = 0.6 * gradient_value + 0.2 * hash_value + 0.2 * feature_value
-                
     return improved_sentiments
 
 def collapse_neutral_words(words, sentiments, threshold=0.05):
@@ -280,88 +287,117 @@ def word_to_color_hash(word, base_hue=None):
     
     return (r, g, b)
 
+def sentiments_to_colors(sentiments):
+    """Vectorized sentiment_to_color: map an array of sentiments to uint8 RGB rows."""
+    sentiments = np.asarray(sentiments, dtype=np.float64)
+    hsv = np.stack((sentiments * 300 / 360,
+                    0.9 + sentiments * 0.1,
+                    0.9 + sentiments * 0.1), axis=1)
+    return colorspace.to_uint8(colorspace.hsv_to_rgb(hsv))
+
+def words_to_hash_colors(words, base_hues=None):
+    """Vectorized word_to_color_hash; each distinct word is only hashed once."""
+    digests = {}
+    for word in words:
+        if word not in digests:
+            digests[word] = hashlib.md5(word.encode()).digest()[:3]
+    hash_bytes = np.frombuffer(b''.join(digests[word] for word in words), dtype=np.uint8).reshape(-1, 3)
+    
+    if base_hues is None:
+        h = hash_bytes[:, 0] / 255
+    else:
+        h = (np.asarray(base_hues, dtype=np.float64) + (hash_bytes[:, 0] / 255 - 0.5) * 0.2) % 1.0
+    s = 0.7 + (hash_bytes[:, 1] / 255) * 0.3
+    v = 0.8 + (hash_bytes[:, 2] / 255) * 0.2
+    
+    return colorspace.to_uint8(colorspace.hsv_to_rgb(np.stack((h, s, v), axis=1)))
+
 def analyze_word_features(words):
-    """Extract multiple features from words for visualization."""
-    features = []
+    """
+    Extract multiple features from words for visualization.
     
-    for word in words:
-        # Length of word (normalized)
-        length = len(word) / 20  # Assume max word length of 20
-        length = min(length, 1.0)  # Cap at 1.0
-        
-        # Vowel ratio
-        vowels = sum(1 for char in word if char.lower() in 'aeiou')
-        vowel_ratio = vowels / max(len(word), 1)
-        
-        # First letter position in alphabet (a=0, z=25)
-        if word and word[0] in string.ascii_letters:
-            first_letter_pos = (ord(word[0].lower()) - ord('a')) / 25
-        else:
-            first_letter_pos = 0.5  # Default for non-letter starting words
-        
-        # Last letter position
-        if word and word[-1] in string.ascii_letters:
-            last_letter_pos = (ord(word[-1].lower()) - ord('a')) / 25
-        else:
-            last_letter_pos = 0.5
-        
-        # Count uppercase letters ratio (measure of emphasis)
-        if word:
-            uppercase_ratio = sum(1 for char in word if char.isupper()) / len(word)
-        else:
-            uppercase_ratio = 0
+    Returns a WordFeatures table (see features.py): features are computed once
+    per distinct word and gathered per word by column, e.g. features['length'].
+    """
+    return word_features_for(words)
+
+class RenderContext:
+    """
+    The standard multi-feature render of a text, computed once.
+    
+    Holds the per-word HSV field and its RGB conversion, so the standard image
+    and every variant derived from it (collapsed, word-length, pixel export)
+    share a single influence computation; image_writer.write_image upscales
+    the RGB pixels as it writes them.
+    """
+    
+    def __init__(self, hsv, width, height):
+        self.hsv = hsv
+        self.width = width
+        self.height = height
         
-        features.append({
-            'word': word,
-            'length': length,
-            'vowel_ratio': vowel_ratio,
-            'first_letter_pos': first_letter_pos,
-            'last_letter_pos': last_letter_pos,
-            'uppercase_ratio': uppercase_ratio
-        })
-    
-    return features
-
-def create_multi_feature_image(words, sentiments, word_features):
-    """Create an image where each pixel's color is based on multiple word features."""
-    num_words = len(words)
+        # Convert to RGB
+        print("Converting to RGB...")
+        self.rgb = colorspace.to_uint8(colorspace.hsv_to_rgb(hsv))
     
-    # Calculate dimensions for a square-like image
+    def image(self):
+        """The standard visualization at one pixel per word."""
+        return colorspace.image_from_rgb(self.rgb, self.width, self.height)
+
+def create_multi_feature_image(words, sentiments, word_features, engine=influence.DEFAULT_ENGINE, workers=1,
+                               max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64):
+    """
+    Create an image where each pixel's color is based on multiple word features.
+    
+    engine selects how weak pixels find the strong pixels that bleed into them
+    ('grid' or 'dense', see influence.py); both give identical output.
+    workers > 1 spreads the influence pass over that many processes, again
+    with identical output. max_bytes caps the influence pass's temporaries
+    per batch; dtype=np.float32 halves them but can shift colours slightly.
+    """
+    context = compute_render_context(words, sentiments, word_features, engine=engine, workers=workers,
+                                     max_bytes=max_bytes, dtype=dtype)
+    return context.image(), context.width, context.height
+
+def compute_render_context(words, sentiments, word_features, engine=influence.DEFAULT_ENGINE, workers=1,
+                           max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64, profiler=None):
+    """Run the multi-feature render and return its RenderContext; see compute_render_field."""
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
+    with profiler.stage('influence', items=len(words)):
+        hsv, width, height = compute_render_field(words, sentiments, word_features, engine=engine, workers=workers,
+                                                  max_bytes=max_bytes, dtype=dtype)
+    with profiler.stage('colour_conversion', items=len(hsv)):
+        return RenderContext(hsv, width, height)
+
+def render_dimensions(num_words):
+    """The (width, height, total_pixels) of the square-like grid the multi-feature render lays words on."""
     width = math.ceil(math.sqrt(num_words))
     height = math.ceil(num_words / width)
-    total_pixels = min(num_words, width * height)
+    return width, height, min(num_words, width * height)
+
+def base_layers(sentiments, word_features, width, start, stop):
+    """
+    The per-pixel part of the multi-feature render, for pixels [start, stop).
     
+    Returns a dict of arrays over those pixels: the inputs (sentiments,
+    vowel_ratios, lengths), the coords, sentiment_diffs,
+    sentiment_intensities, the strong_mask, and the hues, saturations and
+    values before the influence pass and the strong-pixel boosts.
+    """
     # Create coordinate arrays
-    x_coords = np.arange(total_pixels) % width
-    y_coords = np.arange(total_pixels) // width
-    coords = np.stack((x_coords, y_coords), axis=1)
+    positions = np.arange(start, stop)
+    coords = np.stack((positions % width, positions // width), axis=1)
     
     # Convert sentiments and features to numpy arrays
-    sentiments = np.array(sentiments[:total_pixels])
-    vowel_ratios = np.array([f['vowel_ratio'] for f in word_features[:total_pixels]])
-    lengths = np.array([f['length'] for f in word_features[:total_pixels]])
+    sentiments = np.array(sentiments[start:stop])
+    vowel_ratios = feature_column(word_features[start:stop], 'vowel_ratio')
+    lengths = feature_column(word_features[start:stop], 'length')
     
-    # Find strong sentiment indices
+    # Find strong sentiment pixels
     sentiment_diffs = np.abs(sentiments - 0.5)
     strong_mask = sentiment_diffs > 0.35
-    strong_indices = np.where(strong_mask)[0]
-    strong_sentiments = sentiments[strong_indices]
-    strong_coords = coords[strong_indices]
-    
-    # Calculate sentiment types and strengths
-    is_negative = strong_sentiments < 0.5
-    sentiment_types = np.where(is_negative, 'negative', 'positive')
-    base_strengths = sentiment_diffs[strong_indices]
-    influence_strengths = np.where(is_negative, 
-                                 base_strengths * 1.45,
-                                 base_strengths * 0.95)
-    
-    # Pre-calculate all pairwise distances between strong sentiment pixels
-    strong_x = strong_coords[:, 0][:, np.newaxis]
-    strong_y = strong_coords[:, 1][:, np.newaxis]
-    dx = strong_x - strong_x.T
-    dy = strong_y - strong_y.T
-    strong_distances = np.sqrt(dx**2 + dy**2)
     
     # Create output arrays
     hues = sentiments * 0.83
@@ -375,108 +411,71 @@ def create_multi_feature_image(words, sentiments, word_features):
     saturations *= sentiment_intensities
     values = values * sentiment_intensities + (1 - sentiment_intensities) * 0.95
     
-    # Process weak sentiment pixels
-    weak_mask = ~strong_mask
-    weak_indices = np.where(weak_mask)[0]
+    return {
+        'sentiments': sentiments,
+        'vowel_ratios': vowel_ratios,
+        'lengths': lengths,
+        'coords': coords,
+        'sentiment_diffs': sentiment_diffs,
+        'sentiment_intensities': sentiment_intensities,
+        'strong_mask': strong_mask,
+        'hues': hues,
+        'saturations': saturations,
+        'values': values,
+    }
+
+# The base_layers arrays the strong pixels' influence field is built from
+STRONG_INPUTS = ('coords', 'sentiments', 'sentiment_diffs', 'hues', 'vowel_ratios', 'lengths', 'sentiment_intensities')
+
+def strong_layer(strong, width, height):
+    """
+    Cluster boosts and influence field of a render's strong pixels.
     
-    if len(strong_indices) > 0 and len(weak_indices) > 0:
-        print("Processing influence calculations...")
-        
-        # Calculate distances from each weak pixel to each strong pixel
-        weak_coords = coords[weak_indices]
-        
-        # Process in batches to avoid memory issues
-        batch_size = 1000
-        for batch_start in tqdm(range(0, len(weak_indices), batch_size), desc="Processing batches"):
-            batch_end = min(batch_start + batch_size, len(weak_indices))
-            batch_weak = weak_indices[batch_start:batch_end]
-            batch_coords = coords[batch_weak]
-            
-            # Calculate distances to all strong pixels
-            dx = batch_coords[:, 0, np.newaxis] - strong_coords[:, 0]
-            dy = batch_coords[:, 1, np.newaxis] - strong_coords[:, 1]
-            distances = np.sqrt(dx**2 + dy**2)
-            
-            # Calculate linear distances
-            linear_distances = np.abs(batch_weak[:, np.newaxis] - strong_indices)
-            
-            # Calculate similar sentiment boosts for each strong pixel
-            similar_boosts = np.zeros(len(strong_indices))
-            for i in range(len(strong_indices)):
-                nearby_mask = (strong_distances[i] < 4) & (strong_distances[i] > 0)
-                same_type = sentiment_types == sentiment_types[i]
-                boost = np.sum(np.maximum(0, 1 - (strong_distances[i][nearby_mask & same_type] / 4)) * 0.45)
-                similar_boosts[i] = boost
-            
-            # Calculate influence radii
-            base_radii = np.where(is_negative, 4.2, 3.8)
-            strength_factors = np.where(is_negative, 5.7, 4.8)
-            influence_radii = (base_radii + influence_strengths * strength_factors) * (1 + similar_boosts)
-            influence_radii = influence_radii[np.newaxis, :]
-            
-            # Calculate grid and linear weights
-            grid_weights = np.where(is_negative, 0.65, 0.7)
-            linear_weights = np.where(is_negative, 0.35, 0.3)
-            distance_scales = np.where(is_negative, 0.85, 1.0) * (1 - similar_boosts * 0.7)
-            
-            # Calculate adjusted distances
-            adjusted_distances = (grid_weights * distances + linear_weights * (linear_distances / 7)) * distance_scales[np.newaxis, :]
-            
-            # Calculate influences
-            influence_mask = adjusted_distances < influence_radii
-            influences = np.zeros_like(adjusted_distances)
-            masked_distances = adjusted_distances[influence_mask]
-            masked_radii = np.repeat(influence_radii, np.sum(influence_mask, axis=0))[0]
-            masked_boosts = np.repeat(similar_boosts[None, :], batch_end - batch_start, axis=0)[influence_mask]
-            
-            influences[influence_mask] = (1 - (masked_distances / masked_radii)) * (1 + masked_boosts * 1.5)
-            
-            # Adjust influence by type
-            influences[:, is_negative] *= 1.95
-            influences[:, ~is_negative] *= 1.5
-            influences *= influence_strengths
-            
-            # Calculate influenced colors
-            strong_hues = hues[strong_indices]
-            strong_intensities = sentiment_intensities[strong_indices]
-            strong_sats = (0.6 + vowel_ratios[strong_indices] * 0.4) * strong_intensities
-            strong_vals = 0.7 + lengths[strong_indices] * 0.3
-            
-            # Apply cluster boosts to strong colors
-            cluster_boosts = 1 + similar_boosts * 1.5
-            strong_sats = np.minimum(1.0, strong_sats * np.where(is_negative, 2.0, 1.95) * cluster_boosts)
-            strong_vals = np.minimum(1.0, strong_vals * 1.85 * cluster_boosts)
-            
-            # Calculate weighted colors
-            total_influences = np.sum(influences, axis=1)
-            mask = total_influences > 0
-            
-            if np.any(mask):
-                weighted_hues = np.sum(influences[mask] * strong_hues, axis=1) / total_influences[mask]
-                weighted_sats = np.sum(influences[mask] * strong_sats, axis=1) / total_influences[mask]
-                weighted_vals = np.sum(influences[mask] * strong_vals, axis=1) / total_influences[mask]
-                
-                # Calculate blend factors
-                neg_influence = np.sum(influences[:, is_negative], axis=1)
-                pos_influence = np.sum(influences[:, ~is_negative], axis=1)
-                max_blends = np.where(neg_influence > pos_influence, 0.92, 0.88)
-                blend_factors = np.minimum(total_influences * 1.8, max_blends)
-                
-                # Apply blending
-                hues[batch_weak[mask]] = hues[batch_weak[mask]] * (1 - blend_factors[mask]) + weighted_hues * blend_factors[mask]
-                saturations[batch_weak[mask]] = saturations[batch_weak[mask]] * (1 - blend_factors[mask]) + weighted_sats * blend_factors[mask]
-                values[batch_weak[mask]] = values[batch_weak[mask]] * (1 - blend_factors[mask]) + weighted_vals * blend_factors[mask]
+    strong holds the STRONG_INPUTS of every strong pixel, as gathered from
+    base_layers, plus their raster 'indices'. Returns a dict with the
+    strong_indices, is_negative, strong_boosts and the influence field (None
+    if there are no strong pixels).
+    """
+    # Calculate sentiment types and same-type cluster boosts
+    is_negative = strong['sentiments'] < 0.5
+    similar_boosts, strong_boosts = influence.cluster_boosts(strong['coords'], is_negative, width, height)
+    
+    field = None
+    if len(strong['indices']) > 0:
+        field = influence.strong_field(strong['indices'], strong['coords'], strong['sentiments'],
+                                       strong['sentiment_diffs'], similar_boosts, strong['hues'],
+                                       strong['vowel_ratios'], strong['lengths'], strong['sentiment_intensities'])
+    
+    return {
+        'strong_indices': strong['indices'],
+        'is_negative': is_negative,
+        'strong_boosts': strong_boosts,
+        'field': field,
+    }
+
+def render_layers(sentiments, word_features, width, height, total_pixels):
+    """
+    Everything the multi-feature render computes before its influence pass.
+    
+    Returns the base_layers of every pixel, updated with the strong_layer and
+    the weak_indices.
+    """
+    layers = base_layers(sentiments, word_features, width, 0, total_pixels)
+    strong_indices = np.where(layers['strong_mask'])[0]
+    strong = {name: layers[name][strong_indices] for name in STRONG_INPUTS}
+    strong['indices'] = strong_indices
+    layers.update(strong_layer(strong, width, height), weak_indices=np.where(~layers['strong_mask'])[0])
+    return layers
+
+def finish_render(layers):
+    """Boost the strong pixels of render_layers' output in place and stack it into an HSV field."""
+    hues, saturations, values = layers['hues'], layers['saturations'], layers['values']
+    strong_indices = layers['strong_indices']
+    is_negative = layers['is_negative']
     
     # Process strong sentiment pixels
     if len(strong_indices) > 0:
-        # Calculate cluster boosts for strong pixels
-        strong_boosts = np.zeros(len(strong_indices))
-        for i in range(len(strong_indices)):
-            nearby = (strong_distances[i] < 3) & (strong_distances[i] > 0)
-            same_type = sentiment_types == sentiment_types[i]
-            strong_boosts[i] = np.sum(nearby & same_type) * 0.15
-        
-        cluster_boosts = 1 + strong_boosts
+        cluster_boosts = 1 + layers['strong_boosts']
         
         # Apply boosts to strong pixels
         strong_sats = saturations[strong_indices]
@@ -492,21 +491,141 @@ def create_multi_feature_image(words, sentiments, word_features):
         saturations[strong_indices] = strong_sats
         values[strong_indices] = strong_vals
     
-    # Convert to RGB
-    print("Converting to RGB...")
-    hsv = np.stack((hues, saturations, values), axis=1)
-    rgb = np.array([colorsys.hsv_to_rgb(*color) for color in tqdm(hsv, desc="Converting colors")])
-    rgb = (rgb * 255).astype(np.uint8)
+    return np.stack((hues, saturations, values), axis=1)
+
+def compute_render_field(words, sentiments, word_features, engine=influence.DEFAULT_ENGINE, workers=1,
+                         max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64):
+    """Run the multi-feature render's influence pass; returns (hsv, width, height)."""
+    # Calculate dimensions for a square-like image
+    width, height, total_pixels = render_dimensions(len(words))
+    layers = render_layers(sentiments, word_features, width, height, total_pixels)
     
-    # Create image
-    img = Image.new('RGB', (width, height), color='black')
-    pixels = img.load()
+    # Process weak sentiment pixels
+    weak_indices = layers['weak_indices']
+    if layers['field'] is not None and len(weak_indices) > 0:
+        print("Processing influence calculations...")
+        influence.apply_influence(layers['hues'], layers['saturations'], layers['values'], layers['coords'],
+                                  width, height, weak_indices, layers['field'], engine=engine, workers=workers,
+                                  max_bytes=max_bytes, dtype=dtype)
     
-    print("Setting pixels...")
-    for i in tqdm(range(total_pixels), desc="Setting pixels"):
-        pixels[coords[i][0], coords[i][1]] = tuple(rgb[i])
+    return finish_render(layers), width, height
+
+# Bytes a tile of render_tiles and its widened copy may take; every tile is at least one row
+TILE_BYTES = 32 * 2**20
+# Rough bytes of render temporaries per pixel of a tile
+RENDER_BYTES_PER_PIXEL = 256
+
+def tile_rows(width, factor=1, tile_bytes=TILE_BYTES):
+    """How many rows of a width-pixel render fit in a tile of tile_bytes, including its copy widened by factor."""
+    return max(1, tile_bytes // (width * (RENDER_BYTES_PER_PIXEL + 3 * factor)))
+
+def render_tiles(sentiments, word_features, rows_per_tile, engine=influence.DEFAULT_ENGINE, workers=1,
+                 max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64):
+    """
+    Run the multi-feature render strip by strip, yielding (tile, kept) pairs.
+    
+    Every tile is rows_per_tile full-width rows of uint8 RGB (the last can be
+    shorter), shaped (rows, width, 3), with the pixels past the last word
+    black; kept holds its non-neutral pixels for the collapsed visualization. The
+    strong pixels, a small fraction of the text, are gathered and boosted once
+    up front. Each tile then only blends in the strong pixels whose
+    raster_reach overlaps it, its apron, which gives exactly the pixels of
+    compute_render_field while holding one tile of per-pixel arrays at a time.
+    The radius groups of weak pixels that straddle a tile boundary (see
+    influence.pair_radii) get their radius up front too.
+    """
+    width, height, total_pixels = render_dimensions(len(sentiments))
+    tile_pixels = rows_per_tile * width
+    group_size = influence.RADIUS_GROUP_SIZE
+    
+    # Gather the strong pixels, and where each radius group starts, a tile at a time
+    gathered = []
+    group_starts = []
+    weak_before = 0
+    for start in range(0, total_pixels, tile_pixels):
+        layers = base_layers(sentiments, word_features, width, start, min(start + tile_pixels, total_pixels))
+        local = np.flatnonzero(layers['strong_mask'])
+        gathered.append({'indices': local + start, **{name: layers[name][local] for name in STRONG_INPUTS}})
+        weak = np.flatnonzero(~layers['strong_mask'])
+        group_starts.append(weak[-weak_before % group_size::group_size] + start)
+        weak_before += len(weak)
+    strong = {name: np.concatenate([part[name] for part in gathered]) for name in gathered[0]}
+    strong_pixels = strong_layer(strong, width, height)
+    
+    field = strong_pixels['field']
+    fixed_radii = {}
+    if field is not None:
+        reach = influence.raster_reach(field, width)
+        lows = field['indices'] - reach
+        highs = field['indices'] + reach + 1
+        
+        # The groups running across a tile boundary, with every weak pixel of theirs
+        group_starts = np.concatenate(group_starts)
+        group_ends = np.append(group_starts[1:], total_pixels)
+        boundaries = np.arange(tile_pixels, total_pixels, tile_pixels)
+        straddling = np.unique(np.searchsorted(group_starts, boundaries, side='right') - 1)
+        straddling = straddling[straddling >= 0]
+        if len(straddling):
+            members = [np.setdiff1d(np.arange(group_starts[group], group_ends[group]), strong['indices'],
+                                    assume_unique=True) for group in straddling]
+            member_indices = np.concatenate(members)
+            member_coords = np.stack((member_indices % width, member_indices // width), axis=1)
+            member_groups = np.repeat(straddling, [len(part) for part in members])
+            fixed_radii = influence.group_radii(member_indices, member_coords, member_groups, field, width, height,
+                                                engine=engine, dtype=dtype)
+    
+    from tqdm import tqdm
+    
+    weak_before = 0
+    for start in tqdm(range(0, height * width, tile_pixels), desc="Rendering tiles"):
+        stop = min(start + tile_pixels, total_pixels)
+        rows = min(rows_per_tile, height - start // width)
+        layers = base_layers(sentiments, word_features, width, start, stop)
+        
+        # The tile's own strong pixels, in tile-relative indices
+        first, last = np.searchsorted(strong_pixels['strong_indices'], (start, stop))
+        layers.update(strong_indices=strong_pixels['strong_indices'][first:last] - start,
+                      is_negative=strong_pixels['is_negative'][first:last],
+                      strong_boosts=strong_pixels['strong_boosts'][first:last])
+        
+        weak_indices = np.flatnonzero(~layers['strong_mask'])
+        groups = (weak_before + np.arange(len(weak_indices))) // group_size
+        weak_before += len(weak_indices)
+        if field is not None and len(weak_indices) > 0:
+            apron = (lows < stop) & (highs > start)
+            if np.any(apron):
+                tile_field = influence.select_strong(field, apron)
+                # Indices only enter the influence pass as distances to the weak pixels, which are tile-relative
+                tile_field['indices'] = tile_field['indices'] - start
+                tile_radii = {group: fixed_radii[group] for group in {groups[0], groups[-1]} if group in fixed_radii}
+                influence.apply_influence(layers['hues'], layers['saturations'], layers['values'], layers['coords'],
+                                          width, height, weak_indices, tile_field, engine=engine, workers=workers,
+                                          max_bytes=max_bytes, dtype=dtype, progress=False, groups=groups,
+                                          fixed_radii=tile_radii)
+        
+        hsv = finish_render(layers)
+        rgb = np.zeros((rows * width, 3), dtype=np.uint8)
+        rgb[:stop - start] = colorspace.to_uint8(colorspace.hsv_to_rgb(hsv))
+        yield rgb.reshape(rows, width, 3), non_neutral_pixels(rgb[:stop - start], hsv)
+
+def write_tiled_image(path, sentiments, word_features, factor=1, compression=DEFAULT_COMPRESSION,
+                      engine=influence.DEFAULT_ENGINE, workers=1, max_bytes=influence.DEFAULT_MAX_BYTES,
+                      dtype=np.float64, tile_bytes=TILE_BYTES):
+    """
+    Render the standard visualization with render_tiles straight into an image file, upscaled by factor.
     
-    return img, width, height
+    path is a .png or .ppm (see image_writer.py). Only one tile and its
+    widened copy are in memory at a time. Returns (width, height, kept): the
+    render's size and its non-neutral pixels, for the collapsed visualization.
+    """
+    width, height, _ = render_dimensions(len(sentiments))
+    kept = []
+    with open_image(path, width * factor, height * factor, compression) as image:
+        for tile, tile_kept in render_tiles(sentiments, word_features, tile_rows(width, factor, tile_bytes), engine=engine,
+                                 workers=workers, max_bytes=max_bytes, dtype=dtype):
+            image.write_rows(np.repeat(tile, factor, axis=1), repeat=factor)
+            kept.append(tile_kept)
+    return width, height, np.concatenate(kept)
 
 def create_dual_feature_image(words, sentiments, word_features):
     """
@@ -519,34 +638,28 @@ def create_dual_feature_image(words, sentiments, word_features):
     width = math.ceil(math.sqrt(num_words))
     height = math.ceil(num_words / width)
     
-    # Create a new RGB image
-    img = Image.new('RGB', (width, height), color='black')
-    pixels = img.load()
-    
-    for i in range(min(num_words, width * height)):
-        x = i % width
-        y = i // width
-        
-        sentiment = sentiments[i]
-        features = word_features[i]
-        word = words[i]
-        
-        # RED channel: Based on sentiment
-        r = int(255 * (1 - sentiment))  # Negative sentiment = more red
-        
-        # GREEN channel: Based on word length 
-        g = int(255 * features['length'])
-        
-        # BLUE channel: Based on vowel ratio
-        b = int(255 * features['vowel_ratio'])
-        
-        # Apply a hash-based variation to add more visual diversity
-        # while still keeping the data-driven approach
-        r = (r + hash(word) % 30) % 256
-        g = (g + hash(word[::-1]) % 30) % 256  # Use reversed word for different hash
-        b = (b + hash(word + word) % 30) % 256  # Use doubled word for different hash
-        
-        pixels[x, y] = (r, g, b)
+    count = min(num_words, width * height)
+    sentiments = np.asarray(sentiments[:count], dtype=np.float64)
+    lengths = feature_column(word_features[:count], 'length')
+    vowel_ratios = feature_column(word_features[:count], 'vowel_ratio')
+    
+    # RED channel: Based on sentiment (negative sentiment = more red)
+    # GREEN channel: Based on word length
+    # BLUE channel: Based on vowel ratio
+    channels = np.stack(((255 * (1 - sentiments)).astype(np.int64),
+                         (255 * lengths).astype(np.int64),
+                         (255 * vowel_ratios).astype(np.int64)), axis=1)
+    
+    # Apply a hash-based variation to add more visual diversity
+    # while still keeping the data-driven approach. The reversed and doubled
+    # words give each channel a different hash.
+    variations = {}
+    for word in words[:count]:
+        if word not in variations:
+            variations[word] = (hash(word) % 30, hash(word[::-1]) % 30, hash(word + word) % 30)
+    channels = (channels + np.array([variations[word] for word in words[:count]]).reshape(-1, 3)) % 256
+    
+    img = colorspace.image_from_rgb(channels.astype(np.uint8), width, height)
     
     return img, width, height
 
@@ -564,60 +677,42 @@ def create_pattern_image(words, sentiments, word_features):
     width = base_width * scale_factor
     height = base_height * scale_factor
     
-    # Create a new RGB image
-    img = Image.new('RGB', (width, height), color='black')
-    pixels = img.load()
-    
-    for i in range(min(num_words, base_width * base_height)):
-        base_x = (i % base_width) * scale_factor
-        base_y = (i // base_width) * scale_factor
-        
-        sentiment = sentiments[i]
-        features = word_features[i]
-        word = words[i]
-        
-        # Base color from sentiment
-        base_color = sentiment_to_color(sentiment)
-        
-        # Calculate a secondary color based on word features
-        secondary_color = word_to_color_hash(word, sentiment)
-        
-        # Fill the 5x5 grid with a pattern based on word features
-        # Length determines pattern type
-        pattern_type = int(features['length'] * 5)
-        
-        for dx in range(scale_factor):
-            for dy in range(scale_factor):
-                x = base_x + dx
-                y = base_y + dy
-                
-                # Skip if out of bounds
-                if x >= width or y >= height:
-                    continue
-                
-                # Different patterns based on word characteristics
-                if pattern_type == 0:
-                    # Solid color
-                    pixels[x, y] = base_color
-                elif pattern_type == 1:
-                    # Checkerboard
-                    pixels[x, y] = base_color if (dx + dy) % 2 == 0 else secondary_color
-                elif pattern_type == 2:
-                    # Horizontal stripes
-                    pixels[x, y] = base_color if dy % 2 == 0 else secondary_color
-                elif pattern_type == 3:
-                    # Vertical stripes
-                    pixels[x, y] = base_color if dx % 2 == 0 else secondary_color
-                elif pattern_type == 4:
-                    # Diamond
-                    pixels[x, y] = base_color if dx == dy or dx == (scale_factor - 1 - dy) or dx == scale_factor//2 or dy == scale_factor//2 else secondary_color
-                else:
-                    # Gradient
-                    blend_factor = (dx + dy) / (2 * scale_factor)
-                    r = int(base_color[0] * (1 - blend_factor) + secondary_color[0] * blend_factor)
-                    g = int(base_color[1] * (1 - blend_factor) + secondary_color[1] * blend_factor)
-                    b = int(base_color[2] * (1 - blend_factor) + secondary_color[2] * blend_factor)
-                    pixels[x, y] = (r, g, b)
+    count = min(num_words, base_width * base_height)
+    
+    # Base color from sentiment, secondary color from word features
+    base_colors = sentiments_to_colors(sentiments[:count])
+    secondary_colors = words_to_hash_colors(words[:count], sentiments[:count])
+    
+    # Length determines pattern type
+    pattern_types = (feature_column(word_features[:count], 'length') * 5).astype(np.int64)
+    
+    # Per-pattern masks over a [dy, dx] tile: True takes the base color
+    dy, dx = np.mgrid[0:scale_factor, 0:scale_factor]
+    pattern_masks = [
+        np.ones((scale_factor, scale_factor), dtype=bool),  # Solid color
+        (dx + dy) % 2 == 0,  # Checkerboard
+        dy % 2 == 0,  # Horizontal stripes
+        dx % 2 == 0,  # Vertical stripes
+        (dx == dy) | (dx == (scale_factor - 1 - dy)) | (dx == scale_factor//2) | (dy == scale_factor//2),  # Diamond
+    ]
+    
+    base_tiles = base_colors[:, np.newaxis, np.newaxis, :]
+    secondary_tiles = secondary_colors[:, np.newaxis, np.newaxis, :]
+    tiles = np.zeros((base_height * base_width, scale_factor, scale_factor, 3), dtype=np.uint8)
+    for pattern_type, pattern_mask in enumerate(pattern_masks):
+        selected = pattern_types == pattern_type
+        tiles[:count][selected] = np.where(pattern_mask[np.newaxis, :, :, np.newaxis],
+                                           base_tiles[selected], secondary_tiles[selected])
+    
+    # Gradient for everything else
+    selected = pattern_types >= len(pattern_masks)
+    blend_factor = ((dx + dy) / (2 * scale_factor))[np.newaxis, :, :, np.newaxis]
+    tiles[:count][selected] = (base_tiles[selected] * (1 - blend_factor)
+                               + secondary_tiles[selected] * blend_factor).astype(np.uint8)
+    
+    # Lay the tiles out row by row
+    rgb = tiles.reshape(base_height, base_width, scale_factor, scale_factor, 3).transpose(0, 2, 1, 3, 4)
+    img = colorspace.image_from_rgb(rgb, width, height)
     
     return img, width, height
 
@@ -625,15 +720,11 @@ def create_legend():
     """Create a legend image showing the relationship between data and colors."""
     width = 400
     height = 200
-    legend = Image.new('RGB', (width, height), color='white')
-    pixels = legend.load()
+    legend = np.full((height, width, 3), 255, dtype=np.uint8)
     
     # Draw color spectrum
-    for x in range(width):
-        sentiment = x / (width - 1)  # 0 to 1
-        color = sentiment_to_color(sentiment)
-        for y in range(50):
-            pixels[x, y] = color
+    legend[:50] = sentiments_to_colors(np.arange(width) / (width - 1))
+    legend = colorspace.image_from_rgb(legend, width, height)
     
     # Return the legend image
     return legend
@@ -646,153 +737,486 @@ def create_image_from_words(words, sentiments):
     width = math.ceil(math.sqrt(num_words))
     height = math.ceil(num_words / width)
     
-    # Create a new RGB image
-    img = Image.new('RGB', (width, height), color='black')
-    pixels = img.load()
-    
     # Fill the image with pixels
-    for i in range(min(num_words, width * height)):
-        x = i % width
-        y = i // width
-        pixels[x, y] = sentiment_to_color(sentiments[i])
+    colors = sentiments_to_colors(sentiments[:min(num_words, width * height)])
+    img = colorspace.image_from_rgb(colors, width, height)
     
     return img, width, height
 
-def create_collapsed_sentiment_image(words, sentiments, word_features):
-    """Create an image where neutral pixels are completely removed, leaving only colored pixels packed together."""
-    # First, create the standard visualization with bleeding effects
-    img, width, height = create_multi_feature_image(words, sentiments, word_features)
-    pixels = img.load()
-    
-    # Convert pixels to HSV and collect non-neutral pixels
-    kept_pixels = []
-    NEUTRAL_THRESHOLD = 0.2  # Threshold for saturation to consider neutral
+# Threshold for saturation to consider a pixel neutral
+NEUTRAL_THRESHOLD = 0.2
+
+def non_neutral_mask(rgb, hsv=None):
+    """
+    Which uint8 RGB pixels aren't neutral, i.e. have a saturation of at least NEUTRAL_THRESHOLD.
+    
+    Given hsv, the field rgb was converted from, the saturations are read off
+    it instead of converting every pixel back. For a pixel whose hue,
+    saturation and value all lie in [0, 1], truncating to bytes moves its
+    saturation by less than 1 / (255 * value - 1). Only pixels that close to
+    the threshold, or with any channel outside [0, 1], where the HSV
+    saturation says nothing reliable about the bytes, are converted back, so
+    the mask is the same either way.
+    """
+    if hsv is None:
+        return colorspace.rgb_to_hsv(rgb / 255)[:, 1] >= NEUTRAL_THRESHOLD
+    saturations, values = hsv[:, 1], hsv[:, 2]
+    kept = saturations >= NEUTRAL_THRESHOLD
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margin = np.where(values * 255 > 2, 1 / (values * 255 - 1), np.inf) + 1e-6
+    in_range = ((hsv >= 0) & (hsv <= 1)).all(axis=1)
+    unsure = np.flatnonzero(~in_range | (np.abs(saturations - NEUTRAL_THRESHOLD) <= margin))
+    kept[unsure] = colorspace.rgb_to_hsv(rgb[unsure] / 255)[:, 1] >= NEUTRAL_THRESHOLD
+    return kept
+
+def non_neutral_pixels(rgb, hsv=None):
+    """The uint8 RGB rows of rgb that aren't neutral, in order; see non_neutral_mask."""
+    return rgb[non_neutral_mask(rgb, hsv)]
+
+def collapsed_dimensions(num_kept):
+    """The (width, height) of a roughly square image holding num_kept pixels."""
+    new_width = math.ceil(math.sqrt(num_kept))
+    new_height = math.ceil(num_kept / new_width)
+    return new_width, new_height
+
+def create_collapsed_sentiment_image(words, sentiments, word_features, engine=influence.DEFAULT_ENGINE, workers=1, context=None):
+    """
+    Create an image where neutral pixels are completely removed, leaving only colored pixels packed together.
     
-    for y in range(height):
-        for x in range(width):
-            r, g, b = pixels[x, y]
-            h, s, v = colorsys.rgb_to_hsv(r/255, g/255, b/255)
-            if s >= NEUTRAL_THRESHOLD:  # Keep only non-neutral pixels
-                kept_pixels.append((r, g, b))
+    Pass the RenderContext of an existing standard render as context to reuse it.
+    """
+    # First, create the standard visualization with bleeding effects
+    if context is None:
+        context = compute_render_context(words, sentiments, word_features, engine=engine, workers=workers)
+    kept_pixels = non_neutral_pixels(context.rgb, context.hsv)  # Keep only non-neutral pixels
     
     # Calculate new dimensions for a roughly square image
     num_kept = len(kept_pixels)
-    new_width = math.ceil(math.sqrt(num_kept))
-    new_height = math.ceil(num_kept / new_width)
-    
-    # Create new image with just the kept pixels
-    new_img = Image.new('RGB', (new_width, new_height), color='black')
-    new_pixels = new_img.load()
+    new_width, new_height = collapsed_dimensions(num_kept)
     
-    # Fill in the kept pixels in order
-    for i, color in enumerate(kept_pixels):
-        x = i % new_width
-        y = i // new_width
-        new_pixels[x, y] = color
+    # Create new image with just the kept pixels, in order
+    new_img = colorspace.image_from_rgb(kept_pixels, new_width, new_height)
     
-    removed_pixels = width * height - num_kept
+    removed_pixels = context.width * context.height - num_kept
     print(f"Removed {removed_pixels} neutral pixels, new size: {new_width}x{new_height}")
     
     return new_img, new_width, new_height
 
-def create_word_length_image(words, sentiments, word_features):
-    """Create an image where each word is represented by N pixels of the same color, where N is the word length."""
-    # Calculate total space needed (cap individual word length at 10)
-    total_length = sum(min(len(word), 10) for word in words)
+def create_word_length_image(words, sentiments, word_features, engine=influence.DEFAULT_ENGINE, workers=1, context=None):
+    """
+    Create an image where each word is represented by N pixels of the same color, where N is the word length.
+    
+    Every occurrence of a word keeps its own color from the standard render.
+    Pass the RenderContext of an existing standard render as context to reuse it.
+    """
+    # Word lengths, capped at 10, measured once per distinct word
+    vocab, token_ids = build_vocabulary(words)
+    word_lengths = np.minimum(np.array([len(word) for word in vocab], dtype=np.int64), 10)[token_ids]
+    
+    # Calculate total space needed
+    total_length = int(word_lengths.sum())
     width = math.ceil(math.sqrt(total_length))
     height = width
     total_pixels = width * height
     
-    # Pre-allocate arrays
-    expanded_words = []
-    expanded_sentiments = []
-    expanded_features = []
-    
     print("Creating length-based representation...")
-    current_idx = 0
     
     # Get base colors from standard visualization method
-    base_img, _, _ = create_multi_feature_image(words, sentiments, word_features)
-    base_pixels = base_img.load()
-    base_width = math.ceil(math.sqrt(len(words)))
-    
-    # Process each word
-    for i, word in enumerate(words):
-        if current_idx >= total_pixels:
-            break
-            
-        # Get the word's color from the base visualization
-        base_x = i % base_width
-        base_y = i // base_width
-        word_color = base_pixels[base_x, base_y]
-        
-        # Add N pixels of the same color, where N is the word length
-        word_len = min(len(word), 10)  # Cap word length at 10
-        if current_idx + word_len > total_pixels:
-            break
-            
-        # Add the word N times with its color
-        expanded_words.extend([word] * word_len)
-        expanded_sentiments.extend([sentiments[i]] * word_len)
-        expanded_features.extend([word_features[i]] * word_len)
-        current_idx += word_len
+    if context is None:
+        context = compute_render_context(words, sentiments, word_features, engine=engine, workers=workers)
+    base_rgb = context.rgb
+    
+    # Keep the words whose pixels fit, then repeat each word's color N times
+    num_fitting = int(np.searchsorted(np.cumsum(word_lengths), total_pixels, side='right'))
+    num_fitting = min(num_fitting, len(base_rgb))
+    rgb = np.zeros((total_pixels, 3), dtype=np.uint8)
+    expanded = np.repeat(base_rgb[:num_fitting], word_lengths[:num_fitting], axis=0)
+    rgb[:len(expanded)] = expanded
     
     # Create the final image
-    img = Image.new('RGB', (width, height), color='black')
-    pixels = img.load()
-    
-    # Fill pixels with colors
-    for i in range(len(expanded_words)):
-        x = i % width
-        y = i // width
-        base_idx = words.index(expanded_words[i])
-        base_x = base_idx % base_width
-        base_y = base_idx // base_width
-        pixels[x, y] = base_pixels[base_x, base_y]
+    img = colorspace.image_from_rgb(rgb, width, height)
     
     return img, width, height
 
-def main():
-    print("Starting text-to-image conversion...")
+# Versions of the memoized pipeline stages; bump one whenever its output changes
+STAGE_VERSIONS = {
+    'tokens': 3,
+    'sentiment': 1,
+    'unique_sentiment': 2,
+    'enhanced_sentiment': 1,
+    'features': 2,
+    'multi_feature': 3,
+}
+
+def tokenize_document(file_path, cache=None, profiler=None):
+    """
+    Tokenize a UTF-8 text file or PDF into a TokenSequence, memoized in cache.
     
-    # Load and process text
-    try:
-        text = load_text('text.txt')
-        print(f"Loaded text with {len(text)} characters")
-        
-        words = preprocess_text(text)
-        print(f"Extracted {len(words)} words")
-        
-        # Analyze sentiment
-        sentiments, raw_scores = analyze_sentiment(words)
-        
-        # Create version with unique sentiments for neutral words
-        unique_sentiments = unique_sentiment_assignment(words, sentiments)
-        enhanced_unique_sentiments = enhance_sentiment_diversity(unique_sentiments)
+    The file is tokenized as a stream, so the text itself is never held in
+    memory. Returns (words, key), where key identifies the tokens for chaining
+    the analyze_words stages.
+    """
+    if cache is None:
+        cache = StageCache(enabled=False)
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
+    print(f"Loading {file_path} ({os.path.getsize(file_path)} bytes)")
+    
+    def tokenize():
+        tokens = tokenize_chunks(read_document_chunks(file_path, use_cache=cache.enabled))
+        vocab_data, vocab_offsets = pack_vocabulary(tokens.vocab)
+        return {'vocab_data': vocab_data, 'vocab_offsets': vocab_offsets, 'token_ids': tokens.token_ids}
+    
+    with profiler.stage('tokenize') as stage:
+        key = file_key(file_path)
+        key, tokens = cache.run('tokens', key, {'version': STAGE_VERSIONS['tokens']}, tokenize)
+        words = TokenSequence(unpack_vocabulary(tokens['vocab_data'], tokens['vocab_offsets']), tokens['token_ids'])
+        stage.update(items=len(words), cached=cache.hit)
+    print(f"Extracted {len(words)} words")
+    return words, key
+
+def analyze_words(words, key, cache=None, profiler=None, sentiment_backend=DEFAULT_SENTIMENT_BACKEND,
+                  vocab_scores=None, feature_table=None):
+    """
+    Run the sentiment and word feature stages over tokenize_document's output.
+    
+    vocab_scores (a SCORE_DTYPE array) and feature_table, both aligned with
+    words.vocab, supply already computed word scores and features, such as
+    those batch.py computes once over the vocabulary shared by many
+    documents; they must be what sentiment_backend and vocabulary_features
+    give, so the stage cache entries stay interchangeable. Returns
+    (words, sentiments, word_features, key) like analyze_text.
+    """
+    if cache is None:
+        cache = StageCache(enabled=False)
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
+    def score():
+        if vocab_scores is not None:
+            return {'raw_scores': vocab_scores[words.token_ids]}
+        return {'raw_scores': analyze_sentiment(words, backend=sentiment_backend)[1]}
+    
+    # Analyze sentiment
+    with profiler.stage('sentiment', items=len(words.vocab)) as stage:
+        params = {'version': STAGE_VERSIONS['sentiment'], 'backend': sentiment_backend}
+        key, scores = cache.run('sentiment', key, params, score)
+        sentiments = scores['raw_scores']['compound']
+        stage['cached'] = cache.hit
+    
+    # Create version with unique sentiments for neutral words
+    with profiler.stage('unique_sentiment', items=len(words)) as stage:
+        key, unique = cache.run('unique_sentiment', key, {'version': STAGE_VERSIONS['unique_sentiment']},
+                                lambda: {'sentiments': np.asarray(unique_sentiment_assignment(words, sentiments), dtype=np.float64)})
+        stage['cached'] = cache.hit
+    with profiler.stage('enhanced_sentiment', items=len(words)) as stage:
+        key, enhanced = cache.run('enhanced_sentiment', key, {'version': STAGE_VERSIONS['enhanced_sentiment']},
+                                  lambda: {'sentiments': np.asarray(enhance_sentiment_diversity(unique['sentiments']), dtype=np.float64)})
+        stage['cached'] = cache.hit
+    print("Sentiment analysis complete")
+    
+    # Analyze word features
+    with profiler.stage('features', items=len(words.vocab)) as stage:
+        compute = (lambda: feature_table) if feature_table is not None else (lambda: vocabulary_features(words.vocab))
+        key, table = cache.run('features', key, {'version': STAGE_VERSIONS['features']}, compute)
+        word_features = WordFeatures(words.vocab, words.token_ids, table)
+        stage['cached'] = cache.hit
+    print("Word feature analysis complete")
+    
+    return words, enhanced['sentiments'], word_features, key
+
+def analyze_text(file_path, cache=None, profiler=None, sentiment_backend=DEFAULT_SENTIMENT_BACKEND):
+    """
+    Run the text -> words, sentiments and word features stages.
+    
+    The file (UTF-8 text or a PDF) is tokenized as a stream into a
+    TokenSequence, so the text itself is never held in memory. Every stage is
+    memoized in cache (a StageCache) under a key chained from a hash of the
+    file, so unchanged stages are skipped on reruns, and timed by profiler (a
+    Profiler) if one is given. Words are scored by the sentiment_backend named
+    in sentiment.SENTIMENT_BACKENDS. Returns (words, sentiments, word_features, key),
+    where key identifies these outputs for memoizing the stages that consume
+    them.
+    """
+    words, key = tokenize_document(file_path, cache, profiler)
+    return analyze_words(words, key, cache, profiler, sentiment_backend)
+
+def cached_render_context(words, sentiments, word_features, key, cache=None, engine=influence.DEFAULT_ENGINE, workers=1,
+                          max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64, profiler=None):
+    """Memoized compute_render_context, keyed by the analyze_text key of its inputs."""
+    if cache is None:
+        cache = StageCache(enabled=False)
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
+    def render():
+        hsv, width, height = compute_render_field(words, sentiments, word_features, engine=engine, workers=workers,
+                                                  max_bytes=max_bytes, dtype=dtype)
+        return {'hsv': hsv, 'width': width, 'height': height}
+    
+    # Batching and worker count don't change the output, but the precision does
+    params = {'version': STAGE_VERSIONS['multi_feature'], 'dtype': np.dtype(dtype).name}
+    with profiler.stage('influence', items=len(words)) as stage:
+        key, rendered = cache.run('multi_feature', key, params, render)
+        stage['cached'] = cache.hit
+    with profiler.stage('colour_conversion', items=len(rendered['hsv'])):
+        return RenderContext(rendered['hsv'], int(rendered['width']), int(rendered['height']))
+
+def analyze_text_incremental(file_path, previous=None, use_cache=True, profiler=None,
+                             sentiment_backend=DEFAULT_SENTIMENT_BACKEND):
+    """
+    analyze_text for a file that was analyzed before, reusing the earlier run.
+    
+    previous is a snapshot (see incremental.py) of a run over an older version
+    of the file, or None to analyze it from scratch. The new token stream is
+    diffed against the previous one, and only the words of the changed span
+    that the previous run never saw are scored and measured. Neutral-word
+    spreading and the diversity stretch still run over the whole text, since
+    their groups and normalization can reach past the edit, but both are cheap.
+    Returns (words, sentiments, word_features, vocab_scores), with the raw
+    sentiment scores in vocab_scores aligned with words.vocab.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
+    print(f"Loading {file_path} ({os.path.getsize(file_path)} bytes)")
+    with profiler.stage('tokenize') as stage:
+        words = tokenize_chunks(read_document_chunks(file_path, use_cache=use_cache))
+        stage['items'] = len(words)
+    print(f"Extracted {len(words)} words")
+    
+    vocab, token_ids = words.vocab, words.token_ids
+    if previous is None:
+        mapping = np.full(len(vocab), -1, dtype=np.int64)
+        start, end = 0, len(words)
+    else:
+        mapping = vocabulary_mapping(vocab, previous['vocab'])
+        start, end = changed_span(token_ids, previous['token_ids'], mapping)
+        print(f"Words {start} to {end} changed since the last run")
+    
+    # Words of the changed span the previous run never saw; every other word is in the snapshot
+    known = mapping >= 0
+    new_ids = np.unique(token_ids[start:end])
+    new_ids = new_ids[~known[new_ids]]
+    new_words = [vocab[i] for i in new_ids.tolist()]
+    
+    with profiler.stage('score_new_words', items=len(new_words)):
+        vocab_scores = np.zeros(len(vocab), dtype=SCORE_DTYPE)
+        if previous is not None:
+            vocab_scores[known] = previous['vocab_scores'][mapping[known]]
+        vocab_scores[new_ids] = score_words_cached(new_words, sentiment_backend, use_cache)
+    
+    with profiler.stage('new_word_features', items=len(new_words)):
+        new_features = vocabulary_features(new_words)
+        table = {}
+        for column in FEATURE_COLUMNS:
+            table[column] = np.zeros(len(vocab), dtype=np.float64)
+            if previous is not None:
+                table[column][known] = previous['features'][column][mapping[known]]
+            table[column][new_ids] = new_features[column]
+    
+    # The remaining stages run over the whole text without the stage cache, whose keys follow the file, not the edit
+    words, sentiments, word_features, _ = analyze_words(words, None, profiler=profiler,
+                                                        sentiment_backend=sentiment_backend,
+                                                        vocab_scores=vocab_scores, feature_table=table)
+    return words, sentiments, word_features, vocab_scores
+
+def compute_render_field_incremental(sentiments, word_features, previous=None, engine=influence.DEFAULT_ENGINE,
+                                     workers=1, max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64):
+    """
+    compute_render_field that only re-runs the influence pass where an edit can show.
+    
+    previous is a snapshot of an earlier render at the same precision. If the
+    image width is unchanged every word keeps its coordinates, so a weak
+    pixel can only change when its own inputs changed or when a strong pixel
+    whose influence changed, in either render, reaches it; reached_pixels
+    bounds that by each strong pixel's radius and linear-distance term. A
+    weak pixel's radius also depends on the rest of its radius group (see
+    influence.pair_radii), so whole groups are blended again wherever one of
+    their pixels may change or the group's pixels moved, and the rest keep
+    their previous colour, which gives exactly the full render's output.
+    Returns (hsv, width, height).
+    """
+    width, height, total_pixels = render_dimensions(len(sentiments))
+    layers = render_layers(sentiments, word_features, width, height, total_pixels)
+    weak_indices = layers['weak_indices']
+    groups = np.arange(len(weak_indices)) // influence.RADIUS_GROUP_SIZE
+    
+    clean_weak = weak_indices[:0]
+    if previous is not None and previous['width'] == width:
+        previous_features = WordFeatures(previous['vocab'], previous['token_ids'], previous['features'])
+        previous_total = len(previous['hsv'])
+        old = render_layers(previous['sentiments'], previous_features, width, previous['height'], previous_total)
         
-        print("Sentiment analysis complete")
+        # Pixels whose own inputs changed, including every pixel the previous render didn't have
+        common = min(total_pixels, previous_total)
+        dirty = np.ones(total_pixels, dtype=bool)
+        dirty[:common] = ((layers['sentiments'][:common] != old['sentiments'][:common]) |
+                          (layers['vowel_ratios'][:common] != old['vowel_ratios'][:common]) |
+                          (layers['lengths'][:common] != old['lengths'][:common]))
         
-        # Analyze word features
-        original_features = analyze_word_features(words)
-        print("Word feature analysis complete")
+        # Pixels within reach of a strong pixel that appeared, disappeared or changed
+        for field, other in ((layers['field'], old['field']), (old['field'], layers['field'])):
+            if field is not None:
+                changed = influence.changed_strong(field, other)
+                dirty |= influence.reached_pixels(influence.select_strong(field, changed), width, total_pixels,
+                                                  max_bytes)
         
-        print("\nCreating visualizations...")
+        # Groups that lost, gained or reordered weak pixels, or hold a dirty one, are blended again
+        old_weak = old['weak_indices']
+        old_ranks = np.full(total_pixels, -1)
+        old_ranks[old_weak[old_weak < total_pixels]] = np.arange(np.count_nonzero(old_weak < total_pixels))
+        moved = dirty[weak_indices] | (old_ranks[weak_indices] != np.arange(len(weak_indices)))
+        num_groups = -(-len(weak_indices) // influence.RADIUS_GROUP_SIZE)
+        old_sizes = np.clip(len(old_weak) - np.arange(num_groups) * influence.RADIUS_GROUP_SIZE,
+                            0, influence.RADIUS_GROUP_SIZE)
+        stale = ((np.bincount(groups, weights=moved, minlength=num_groups) > 0) |
+                 (np.bincount(groups, minlength=num_groups) != old_sizes))
         
-        # 1. Standard multi-feature visualization
-        print("\nCreating standard visualization...")
-        img1, width1, height1 = create_multi_feature_image(words, enhanced_unique_sentiments, original_features)
-        img1 = img1.resize((width1 * 20, height1 * 20), Image.Resampling.NEAREST)
-        img1.save('standard_visualization.png')
+        clean_weak = weak_indices[~stale[groups]]
+        weak_indices = weak_indices[stale[groups]]
+        groups = groups[stale[groups]]
+        print(f"Re-rendering {len(weak_indices)} of {total_pixels} pixels")
+    
+    if layers['field'] is not None and len(weak_indices) > 0:
+        print("Processing influence calculations...")
+        influence.apply_influence(layers['hues'], layers['saturations'], layers['values'], layers['coords'],
+                                  width, height, weak_indices, layers['field'], engine=engine, workers=workers,
+                                  max_bytes=max_bytes, dtype=dtype, groups=groups)
+    
+    hsv = finish_render(layers)
+    if len(clean_weak):
+        hsv[clean_weak] = previous['hsv'][clean_weak]
+    return hsv, width, height
+
+def incremental_params(sentiment_backend=DEFAULT_SENTIMENT_BACKEND, dtype=np.float64):
+    """The parameters a snapshot must have been written with to be reused."""
+    return {'stages': STAGE_VERSIONS, 'sentiment_backend': sentiment_backend, 'dtype': np.dtype(dtype).name}
+
+def incremental_render_context(file_path, previous=None, use_cache=True, profiler=None,
+                               sentiment_backend=DEFAULT_SENTIMENT_BACKEND, engine=influence.DEFAULT_ENGINE,
+                               workers=1, max_bytes=influence.DEFAULT_MAX_BYTES, dtype=np.float64):
+    """
+    Analyze and render file_path incrementally against the snapshot previous.
+    
+    Returns (words, sentiments, word_features, vocab_scores, context); the
+    caller saves them as the next snapshot once its outputs are written.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
+    words, sentiments, word_features, vocab_scores = analyze_text_incremental(
+        file_path, previous, use_cache=use_cache, profiler=profiler, sentiment_backend=sentiment_backend)
+    with profiler.stage('influence', items=len(words)):
+        hsv, width, height = compute_render_field_incremental(sentiments, word_features, previous, engine=engine,
+                                                              workers=workers, max_bytes=max_bytes, dtype=dtype)
+    with profiler.stage('colour_conversion', items=len(hsv)):
+        context = RenderContext(hsv, width, height)
+    return words, sentiments, word_features, vocab_scores, context
+
+def add_render_arguments(parser, workers=True, images=True):
+    """
+    Add the rendering options shared by the command-line scripts to an argparse parser.
+    
+    --no-cache, --max-memory, --float32 and --sentiment are always added;
+    workers adds --workers and images adds --image-format and --compression.
+    """
+    parser.add_argument('--no-cache', action='store_true', help="recompute every pipeline stage")
+    if workers:
+        parser.add_argument('--workers', type=int, default=1,
+                            help="processes for the influence pass (0 uses every CPU)")
+    parser.add_argument('--max-memory', type=int, default=influence.DEFAULT_MAX_BYTES // 2**20,
+                        help="MB of temporaries per influence batch (default: %(default)s)")
+    parser.add_argument('--float32', action='store_true',
+                        help="compute the influence pass in float32 (less memory, slightly different colours)")
+    parser.add_argument('--sentiment', choices=tuple(SENTIMENT_BACKENDS), default=DEFAULT_SENTIMENT_BACKEND,
+                        help="sentiment backend: the bundled compiled lexicon or NLTK's VADER (default: %(default)s)")
+    if images:
+        parser.add_argument('--image-format', choices=('png', 'ppm'), default='png',
+                            help="write the images as PNG or as uncompressed binary PPM (default: %(default)s)")
+        parser.add_argument('--compression', type=int, choices=range(10), default=DEFAULT_COMPRESSION,
+                            metavar='LEVEL', help="PNG zlib compression level, 0-9 (default: %(default)s)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a text file or PDF as sentiment visualizations.")
+    parser.add_argument('source', nargs='?', default='text.txt', help="UTF-8 text file or PDF to render")
+    add_render_arguments(parser)
+    parser.add_argument('--profile', metavar='REPORT',
+                        help="write per-stage time and memory to REPORT (.json or .csv)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help="only re-render what changed since the last --incremental run over SOURCE")
+    mode.add_argument('--tiled', action='store_true',
+                      help="render and write the images tile by tile, in bounded memory for very large texts")
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count()
+    dtype = np.float32 if args.float32 else np.float64
+    profiler = Profiler(enabled=bool(args.profile))
+    
+    print("Starting text-to-image conversion...")
+    
+    # Load and process text
+    try:
+        standard_path = f'standard_visualization.{args.image_format}'
+        collapsed_path = f'collapsed_visualization.{args.image_format}'
+        if args.tiled:
+            cache = StageCache(enabled=not args.no_cache)
+            words, enhanced_unique_sentiments, original_features, key = analyze_text(args.source, cache, profiler,
+                                                                                     args.sentiment)
+            
+            # 1. Standard multi-feature visualization, rendered and written tile by tile
+            print("\nCreating standard visualization tile by tile...")
+            with profiler.stage('standard_image', items=len(words)):
+                width, height, kept_pixels = write_tiled_image(standard_path, enhanced_unique_sentiments, original_features,
+                                                      factor=20, compression=args.compression, workers=workers,
+                                                      max_bytes=args.max_memory * 2**20, dtype=dtype)
+        else:
+            if args.incremental:
+                # Diff against the previous run's snapshot instead of the stage cache
+                snapshot = snapshot_path(args.source, 'text_to_image')
+                params = incremental_params(args.sentiment, dtype)
+                words, enhanced_unique_sentiments, original_features, vocab_scores, context = \
+                    incremental_render_context(args.source, load_snapshot(snapshot, params),
+                                               use_cache=not args.no_cache, profiler=profiler,
+                                               sentiment_backend=args.sentiment, workers=workers,
+                                               max_bytes=args.max_memory * 2**20, dtype=dtype)
+            else:
+                cache = StageCache(enabled=not args.no_cache)
+                words, enhanced_unique_sentiments, original_features, key = analyze_text(args.source, cache, profiler,
+                                                                                         args.sentiment)
+                
+                print("\nCreating visualizations...")
+                print("\nCreating standard visualization...")
+                context = cached_render_context(words, enhanced_unique_sentiments, original_features, key, cache,
+                                                workers=workers, max_bytes=args.max_memory * 2**20, dtype=dtype,
+                                                profiler=profiler)
+            
+            # 1. Standard multi-feature visualization, upscaled as it is written
+            with profiler.stage('standard_image', items=context.width * context.height):
+                write_image(standard_path, context.rgb, context.width, context.height, factor=20,
+                            compression=args.compression)
+            width, height, kept_pixels = context.width, context.height, non_neutral_pixels(context.rgb, context.hsv)
         
-        # 2. Collapsed sentiment visualization
+        # 2. Collapsed sentiment visualization, from the non-neutral pixels of the same render
         print("\nCreating collapsed sentiment visualization...")
-        img2, width2, height2 = create_collapsed_sentiment_image(words, enhanced_unique_sentiments, original_features)
-        img2 = img2.resize((width2 * 20, height2 * 20), Image.Resampling.NEAREST)
-        img2.save('collapsed_visualization.png')
+        with profiler.stage('collapsed_image', items=len(kept_pixels)):
+            width2, height2 = collapsed_dimensions(len(kept_pixels))
+            print(f"Removed {width * height - len(kept_pixels)} neutral pixels, new size: {width2}x{height2}")
+            write_image(collapsed_path, kept_pixels, width2, height2, factor=20, compression=args.compression)
+        
+        if args.incremental:
+            # Only record the run once its images are written, so a failed write re-renders next time
+            save_snapshot(snapshot, params, words.vocab, words.token_ids, vocab_scores, original_features.table,
+                          enhanced_unique_sentiments, context.hsv, context.width, context.height)
         
         print("\nVisualizations created:")
-        print("1. Standard visualization (standard_visualization.png)")
-        print("2. Collapsed sentiment visualization (collapsed_visualization.png)")
+        print(f"1. Standard visualization ({standard_path})")
+        print(f"2. Collapsed sentiment visualization ({collapsed_path})")
+        
+        if args.profile:
+            print("\n" + profiler.summary())
+            profiler.write(args.profile, script='text_to_image', source=args.source)
         
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,115 @@
+"""
+Streaming tokenization and vocabulary indexing.
+
+Texts are read in chunks and turned straight into integer token ids, so a
+corpus is held as its vocabulary plus four bytes per token rather than as one
+string and a list of words.
+"""
+import codecs
+import re
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+# Same tokens as preprocess_text: maximal runs of word characters
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+CHUNK_SIZE = 1 << 20
+
+
+class TokenSequence(Sequence):
+    """A read-only list of words backed by a vocabulary and an int32 id array."""
+
+    def __init__(self, vocab, token_ids):
+        self.vocab = vocab
+        self.token_ids = token_ids
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TokenSequence(self.vocab, self.token_ids[index])
+        return self.vocab[self.token_ids[index]]
+
+    def __iter__(self):
+        vocab = self.vocab
+        return (vocab[token_id] for token_id in self.token_ids.tolist())
+
+
+def build_vocabulary(words):
+    """
+    Map each distinct word to an integer id, in order of first appearance.
+
+    Returns (vocab, token_ids) where vocab[token_ids[i]] == words[i].
+    """
+    if isinstance(words, TokenSequence):
+        return words.vocab, words.token_ids
+
+    ids = {}
+    token_ids = np.fromiter((ids.setdefault(word, len(ids)) for word in words),
+                            dtype=np.int32, count=len(words))
+    return list(ids), token_ids
+
+
+def pack_vocabulary(vocab):
+    """
+    Encode vocab for storing as (data, offsets) arrays.
+
+    data holds every word's UTF-8 bytes back to back and word i is
+    data[offsets[i]:offsets[i + 1]], so the arrays take as much space as the
+    words themselves, unlike a string array padded to the longest word.
+    """
+    encoded = [word.encode('utf-8') for word in vocab]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(word) for word in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_vocabulary(data, offsets):
+    """The vocabulary list pack_vocabulary encoded as data and offsets."""
+    data = data.tobytes()
+    return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def read_text_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """Yield a UTF-8 text file's contents as strings of about chunk_size bytes."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(file_path, 'rb') as file:
+        while True:
+            data = file.read(chunk_size)
+            text = decoder.decode(data, final=not data)
+            if text:
+                yield text
+            if not data:
+                return
+
+
+def iter_chunk_tokens(chunks):
+    """
+    Yield lists of lowercased tokens from an iterable of text chunks.
+
+    Everything after a chunk's last whitespace is held back and joined with
+    the start of the next one. Whitespace both ends any word and stops the
+    context lowercasing looks at (Greek final sigma), so tokens match
+    tokenizing the whole text at once.
+    """
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        cut = len(text)
+        while cut > 0 and not text[cut - 1].isspace():
+            cut -= 1
+        carry = text[cut:]
+        yield TOKEN_PATTERN.findall(text[:cut].lower())
+    if carry:
+        yield TOKEN_PATTERN.findall(carry.lower())
+
+
+def tokenize_chunks(chunks):
+    """Stream text chunks into a TokenSequence, growing the id array as tokens arrive."""
+    ids = {}
+    token_ids = array('i')
+    for tokens in iter_chunk_tokens(chunks):
+        token_ids.extend(ids.setdefault(token, len(ids)) for token in tokens)
+    return TokenSequence(list(ids), np.frombuffer(token_ids, dtype=np.int32))